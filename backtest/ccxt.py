@@ -5,7 +5,9 @@ from datetime import datetime
 from pymongo.database import Database
 import pandas as pd
 from src.core.time import current_datetime
-from src.utils.calc import validate_precision
+from src.utils.calc import validate_precision, calc_precision
+from . import offline as offline_data
+from .orders import OrderStore
 import numpy as np
 
 
@@ -15,7 +17,14 @@ import numpy as np
 def getMockCcxt(exchangeType: type[ccxt.okx],
                 initial_balance: dict[str, float],
                 db: Database,
-                *args, **kwargs):
+                *args,
+                offline: str | None = None,
+                max_volume_ratio: float | None = None,
+                **kwargs):
+    # offline: directory recorded with backtest.offline.record, markets and
+    # klines are then served from it without any request to the exchange,
+    # max_volume_ratio: limit orders of a bar ticked with its volume fill
+    # at most this share of it together, the rest stays open
 
     class MockCcxt(exchangeType):
         def __init__(self, *args, **kwargs):
@@ -23,11 +32,22 @@ def getMockCcxt(exchangeType: type[ccxt.okx],
             self.mock_balance = initial_balance
             self.order_id_counter = 0
             self.now = None
+            # last price of the symbols not ticked on their own
             self.price = None
+            # last prices of the symbols ticked with __tick__(..., symbol=)
+            self.prices: dict[str, float] = {}
             self._market_info = self.load_markets()
             
-            # MongoDB collection for all orders
-            self.orders_collection = db['ccxt/orders']
+            # orders are matched in memory and written behind to MongoDB,
+            # call self.orders.close() at the end of a run
+            self.orders = OrderStore(db['ccxt/orders'] if db is not None else None)
+
+        def load_markets(self, reload=False, params={}):
+            if offline is None:
+                return super().load_markets(reload, params)
+            if reload or self.markets is None:
+                self.set_markets(offline_data.load_markets(offline, self.id))
+            return self.markets
 
         def fetch_balance(self, params: Dict[str, Any] = {}) -> Balances:
             return {
@@ -72,48 +92,94 @@ def getMockCcxt(exchangeType: type[ccxt.okx],
                 'price': price,
                 'status': 'open',
                 'timestamp': current_datetime().timestamp(),
+                'filled': 0.0,
+                'remaining': amount,
+                'cost': 0.0,
+                'average': None,
+                'fee': {
+                    'cost': 0.0,
+                    'currency': symbol.split('/')[0 if side == 'buy' else 1],
+                    'rate': self._get_fee_rate(symbol, order_type),
+                },
             }
-            # Insert the order into MongoDB
-            self.orders_collection.insert_one(order)
-            self.__tick__(self.price, self.price, self.price)
-            return order
+            self.orders.insert(order)
+            # as placed, later states through fetch_order
+            created = dict(order)
+            price = self.prices.get(symbol, self.price)
+            if price is not None:
+                self._match(symbol, price, price, price)
+            return created
+
+        def create_orders(self, orders: list[Dict[str, Any]], params: Dict[str, Any] = {}):
+            return [
+                self.create_order(o['symbol'], o['type'], o['side'], o['amount'],
+                                  o.get('price'), { **o.get('params', {}), **params })
+                for o in orders
+            ]
+
+        def cancel_order(self, id: str, symbol: str | None = None, params: Dict[str, Any] = {}):
+            order = self.orders.get(id)
+            if not order:
+                raise ccxt.OrderNotFound(f'Order {id} not found')
+            if order['status'] == 'open':
+                # left in its book until it reaches the top
+                order['status'] = 'canceled'
+                self.orders.update(order)
+            return dict(order)
 
         def fetch_order(self, id: str, symbol: str | None = None, params: Dict[str, Any] = {}):
-            # Fetch the order from MongoDB
-            order = self.orders_collection.find_one({'id': id})
+            order = self.orders.get(id)
             if order:
-                return order
+                return dict(order)
             else:
                 raise ccxt.OrderNotFound(f'Order {id} not found')
 
         def __tick__(self,
                      price_close: float,
                      price_high: float,
-                     price_low: float):
-            self.price = price_close
-            closed_orders = []
+                     price_low: float,
+                     symbol: str | None = None,
+                     volume: float | None = None):
+            # symbol: the kline is of this symbol only. Otherwise it is of
+            # every symbol not ticked on its own, the books of the others
+            # match at their own last price
+            if symbol is not None:
+                self.prices[symbol] = price_close
+                self._match(symbol, price_close, price_high, price_low, volume)
+                return
 
-            # Fetch open orders from MongoDB
-            open_orders = list(self.orders_collection.find({'status': 'open'}, {'_id': 0}))
-
-            for order in open_orders:
-                if order['type'] == 'market':
-                    order['status'] = 'closed'
-                    order['price'] = price_close
-                    self._adjust_balance(order, price_close)
-                    closed_orders.append(order)
-                elif order['type'] == 'limit' and order['side'] == 'buy' and price_low <= order['price']:
-                    order['status'] = 'closed'
-                    self._adjust_balance(order, order['price'])
-                    closed_orders.append(order)
-                elif order['type'] == 'limit' and order['side'] == 'sell' and price_high >= order['price']:
-                    order['status'] = 'closed'
-                    self._adjust_balance(order, order['price'])
-                    closed_orders.append(order)
-
-            # Update MongoDB to reflect closed orders
-            for order in closed_orders:
-                self.orders_collection.update_one({'id': order['id']}, {'$set': order})
+            self.price = price_close
+            for symbol in list(self.orders.books):
+                if symbol in self.prices:
+                    price = self.prices[symbol]
+                    self._match(symbol, price, price, price)
+                else:
+                    self._match(symbol, price_close, price_high, price_low, volume)
+
+        def _match(self, symbol: str,
+                   price_close: float,
+                   price_high: float,
+                   price_low: float,
+                   volume: float | None = None):
+            # base amount the limit orders of the bar may fill
+            budget = [np.inf if volume is None or max_volume_ratio is None
+                      else max_volume_ratio * volume]
+
+            def fill(order, price):
+                amount = order['remaining']
+                if order['type'] == 'limit':
+                    if budget[0] < amount:
+                        # the volume of the bar caps the fill
+                        amount = calc_precision(budget[0],
+                                                self._market_info[order['symbol']]['precision']['amount'],
+                                                np.floor)
+                    budget[0] -= amount
+                if amount > 0:
+                    self._fill(order, amount, price)
+                    self.orders.update(order)
+                return budget[0] > 0 and amount > 0
+
+            self.orders.book(symbol).match(price_close, price_high, price_low, fill)
 
         def _get_fee_rate(self, symbol, order_type):
             if order_type == 'market':
@@ -121,30 +187,43 @@ def getMockCcxt(exchangeType: type[ccxt.okx],
             else:
                 return self._market_info[symbol]['maker']
 
-        def _adjust_balance(self, order, fill_price):
-            if order['side'] == 'buy':
-                cost = order['amount'] * fill_price
-                fee_rate = self._get_fee_rate(order['symbol'], order['type'])
+        def _fill(self, order, amount, fill_price):
+            # trade amount of order at fill_price, balances first so that
+            # an order stays as is if they fall short
+            base, quote = order['symbol'].split('/')
+            cost = amount * fill_price
+            fee_rate = order['fee']['rate']
 
-                if self.mock_balance[order['symbol'].split('/')[1]] < cost:
+            if order['side'] == 'buy':
+                if self.mock_balance[quote] < cost:
                     raise ccxt.InsufficientFunds(f'Insufficient funds to cover {cost}/'
-                                                 f"{self.mock_balance[order['symbol'].split('/')[1]]}"
-                                                 f'{order["symbol"].split("/")[1]} ({fill_price=})')
+                                                 f'{self.mock_balance[quote]}'
+                                                 f'{quote} ({fill_price=})')
                 
-                self.mock_balance[order['symbol'].split('/')[1]] -= cost
-                self.mock_balance[order['symbol'].split('/')[0]] += order['amount'] * (1 - fee_rate)
+                self.mock_balance[quote] -= cost
+                self.mock_balance[base] += amount * (1 - fee_rate)
+                order['fee']['cost'] += amount * fee_rate
 
             elif order['side'] == 'sell':
-                proceeds = order['amount'] * fill_price
-                fee_rate = self._get_fee_rate(order['symbol'], order['type'])
-
-                if self.mock_balance[order['symbol'].split('/')[0]] < order['amount']:
-                    raise ccxt.InsufficientFunds(f'Insufficient funds to sell {order["amount"]}/'
-                                                 f"{self.mock_balance[order['symbol'].split('/')[0]]}"
-                                                 f'{order["symbol"].split("/")[0]} ({fill_price=})')
-
-                self.mock_balance[order['symbol'].split('/')[0]] -= order['amount']
-                self.mock_balance[order['symbol'].split('/')[1]] += proceeds * (1 - fee_rate)
+                if self.mock_balance[base] < amount:
+                    raise ccxt.InsufficientFunds(f'Insufficient funds to sell {amount}/'
+                                                 f'{self.mock_balance[base]}'
+                                                 f'{base} ({fill_price=})')
+
+                self.mock_balance[base] -= amount
+                self.mock_balance[quote] += cost * (1 - fee_rate)
+                order['fee']['cost'] += cost * fee_rate
+
+            order['filled'] += amount
+            order['remaining'] = 0.0 if amount == order['remaining'] else \
+                calc_precision(order['remaining'] - amount,
+                               self._market_info[order['symbol']]['precision']['amount'])
+            order['cost'] += cost
+            order['average'] = order['cost'] / order['filled']
+            if order['remaining'] == 0:
+                order['status'] = 'closed'
+                if order['type'] == 'market':
+                    order['price'] = fill_price
 
         def fetch_ohlcv(self, symbol: str, timeframe='1m', since: int | None = None, limit: int | None = None, params: Any = {}):
             if not since:
@@ -155,6 +234,9 @@ def getMockCcxt(exchangeType: type[ccxt.okx],
                 limit = min(limit,
                             int((current_datetime().timestamp() - since / 1000) / \
                                 pd.to_timedelta(timeframe).total_seconds()))
+            if offline is not None:
+                return offline_data.fetch_ohlcv(offline, self.id, symbol, timeframe,
+                                                since=int(since), limit=limit)
             res = super().fetch_ohlcv(symbol=symbol, timeframe=timeframe, since=since,
                                       limit=limit, params=params)
             return res
@@ -32,6 +32,13 @@ end_date = pd.to_datetime('2023-01-01')
 start_equity = 1_000
 
 
+# directory record_backtest_data.py records the markets and klines into
+BACKTEST_DATA = 'backtest-data'
+# set to BACKTEST_DATA once recorded, backtests then run without network and
+# reproduce exactly, None fetches them from the exchange
+OFFLINE_DATA = None
+
+
 
 
 
@@ -84,5 +91,5 @@ ex = getMockCcxt(ccxt.okx, { 'USDT': start_equity, 'BTC': 0 }, db, {
     'secret': API_SECRET,      # Replace with your actual Secret key
     'password': API_PASS,
     'enableRateLimit': True,          # Enable rate limit handling by CCXT
-})
+}, offline=OFFLINE_DATA)
 
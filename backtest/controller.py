@@ -22,6 +22,9 @@ class MockController(Controller):
         self.state = state
         
         if state:
+            # every module's state in one round of queries
+            state.load([ f'{name}/{path}' for name, module in self.modules.items()
+                         for path in module.state_paths() ], create=False)
             for name, module in self.modules.items():
                 module.inject_state(state.sub_state(name))
     
@@ -0,0 +1,98 @@
+from datetime import datetime
+import ccxt
+import pandas as pd
+import numpy as np
+import json
+import os
+from src.core.logger import logger
+from src.core.store import KlineStore
+from src.core.time import current_datetime
+
+
+
+
+# klines a recorded exchange returns per fetch_ohlcv by default and at most,
+# as okx does for its candles endpoints
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 300
+
+
+
+
+
+def _markets_path(root: str, exchange: str):
+    return os.path.join(root, exchange, 'markets.json')
+
+
+
+def record(ex: ccxt.Exchange,
+           root: str,
+           symbols: list[str],
+           timeframe: str,
+           start: datetime,
+           end: datetime,
+           page_size=DEFAULT_LIMIT):
+    # capture the markets of symbols and their closed klines of [start, end)
+    # under root, for getMockCcxt(..., offline=root) to serve them
+    tfdelta = pd.to_timedelta(timeframe)
+    markets = ex.load_markets()
+    os.makedirs(os.path.join(root, ex.id), exist_ok=True)
+    tmp = _markets_path(root, ex.id) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({ s: markets[s] for s in symbols }, f)
+    os.replace(tmp, _markets_path(root, ex.id))
+
+    end = min(pd.Timestamp(end), pd.Timestamp(current_datetime()) - tfdelta)
+    for symbol in symbols:
+        store = KlineStore(root, ex.id, symbol, timeframe)
+        since = pd.Timestamp(start)
+        while since < end:
+            rows = ex.fetch_ohlcv(symbol, timeframe,
+                                  since=int(since.timestamp() * 1000),
+                                  limit=page_size)
+            rows = [ r for r in rows if pd.to_datetime(r[0], unit='ms') < end ]
+            if len(rows) == 0:
+                # before the listing
+                since += page_size * tfdelta
+                continue
+
+            df = pd.DataFrame([ r[1:] for r in rows ], columns=KlineStore.columns,
+                              index=pd.to_datetime([ r[0] for r in rows ], unit='ms'))
+            store.append(df)
+            since = df.index[-1] + tfdelta
+        logger.info(f'record | {symbol} {timeframe} {store.span()}')
+
+
+
+def load_markets(root: str, exchange: str) -> dict:
+    with open(_markets_path(root, exchange)) as f:
+        return json.load(f)
+
+
+
+def fetch_ohlcv(root: str, exchange: str,
+                symbol: str, timeframe: str,
+                since: int | None = None,
+                limit: int | None = None) -> list[list]:
+    # recorded klines paged as the exchange does: at most MAX_LIMIT of them
+    # opened in [since, since + limit), or the last limit ones
+    tfdelta = pd.to_timedelta(timeframe)
+    store = KlineStore(root, exchange, symbol, timeframe)
+    first, count = store.span()
+    if first is None:
+        return []
+
+    limit = min(DEFAULT_LIMIT if limit is None else limit, MAX_LIMIT)
+    if limit <= 0:
+        return []
+    if since is None:
+        start = first + max(count - limit, 0) * tfdelta
+    else:
+        start = pd.to_datetime(since, unit='ms')
+    end = start + limit * tfdelta
+    # first bar opened at or after start
+    start = first + max(int(np.ceil((start - first) / tfdelta)), 0) * tfdelta
+
+    df = store.read(start, max(int((end - start) / tfdelta), 0)).dropna()
+    return [ [ int(t.value // 10**6), *row ]
+             for t, row in zip(df.index, df.to_numpy().tolist()) ]
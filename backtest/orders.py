@@ -0,0 +1,168 @@
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+from threading import Event, Lock, Thread
+from typing import Callable
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+import atexit
+
+
+
+
+class OrderBook:
+    """Open orders of one symbol: market orders in a queue, limit orders in
+    a max-heap of buy prices and a min-heap of sell prices, ties by time.
+    Orders no longer open are dropped when they reach the top of a heap, so
+    matching a bar costs O(k log n) for the k orders it crosses."""
+
+    def __init__(self) -> None:
+        self._market: deque[dict] = deque()
+        self._bids: list[tuple[float, int, dict]] = []
+        self._asks: list[tuple[float, int, dict]] = []
+        self._seq = count()
+        # time priority of the orders, kept when they are requeued
+        self._seqs: dict[str, int] = {}
+
+    def add(self, order: dict):
+        seq = self._seqs.setdefault(order['id'], next(self._seq))
+        if order['type'] == 'market':
+            self._market.append(order)
+        elif order['side'] == 'buy':
+            heappush(self._bids, (-order['price'], seq, order))
+        else:
+            heappush(self._asks, (order['price'], seq, order))
+
+    def match(self, close: float, high: float, low: float,
+              fill: Callable[[dict, float], bool]):
+        # fill(order, price) every market order at close, then the limit
+        # orders the bar crosses best price first at their price, until
+        # fill returns False. Orders left open stay in the book.
+        while self._market:
+            order = self._market[0]
+            if order['status'] == 'open':
+                fill(order, close)
+                if order['status'] == 'open':
+                    break
+            self._seqs.pop(self._market.popleft()['id'], None)
+
+        requeue = []
+        try:
+            for heap, sign, crosses in [(self._bids, -1, lambda p: p >= low),
+                                        (self._asks, 1, lambda p: p <= high)]:
+                while heap:
+                    entry = heap[0]
+                    if entry[2]['status'] != 'open':
+                        self._seqs.pop(heappop(heap)[2]['id'], None)
+                        continue
+                    if not crosses(sign * entry[0]):
+                        break
+                    heappop(heap)
+                    requeue.append((heap, entry))
+                    more = fill(entry[2], sign * entry[0])
+                    if not more:
+                        break
+        finally:
+            for heap, entry in requeue:
+                if entry[2]['status'] == 'open':
+                    heappush(heap, entry)
+                else:
+                    self._seqs.pop(entry[2]['id'], None)
+
+
+
+
+class OrderStore:
+    """Orders of MockCcxt kept in memory, indexed by id along with an
+    index of the open ones, with write-behind persistence: changed orders
+    are upserted into collection in bulk by a background thread every
+    flush_interval seconds or once flush_batch of them are pending, and on
+    flush() / close(). Without a collection they only live in memory."""
+
+    def __init__(self, collection: Collection | None = None,
+                 flush_interval=1.0,
+                 flush_batch=500) -> None:
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        self._orders: dict[str, dict] = {}
+        self._open: dict[str, dict] = {}
+        self.books: dict[str, OrderBook] = {}
+
+        # snapshots of the orders changed since the last flush
+        self._dirty: dict[str, dict] = {}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self._closed = False
+        self._thread: Thread | None = None
+        self._indexed = False
+
+    def insert(self, order: dict):
+        self._orders[order['id']] = order
+        if order['status'] == 'open':
+            self._open[order['id']] = order
+            self.book(order['symbol']).add(order)
+        self._mark(order)
+
+    def update(self, order: dict):
+        # after changing an order of the store in place
+        if order['status'] != 'open':
+            self._open.pop(order['id'], None)
+        self._mark(order)
+
+    def book(self, symbol: str) -> OrderBook:
+        if symbol not in self.books:
+            self.books[symbol] = OrderBook()
+        return self.books[symbol]
+
+    def get(self, id: str) -> dict | None:
+        return self._orders.get(id)
+
+    def open(self, symbol: str | None = None) -> list[dict]:
+        # open orders in creation order
+        return [ o for o in self._open.values()
+                 if symbol is None or o['symbol'] == symbol ]
+
+    def _mark(self, order: dict):
+        if self.collection is None:
+            return
+        with self._lock:
+            self._dirty[order['id']] = dict(order)
+            pending = len(self._dirty)
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='order-store', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        if pending >= self.flush_batch:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        # write the pending orders now
+        if self.collection is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            if not self._indexed:
+                self.collection.create_index('id')
+                self._indexed = True
+            self.collection.bulk_write([ ReplaceOne({ 'id': id }, order, upsert=True)
+                                         for id, order in dirty.items() ],
+                                       ordered=False)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,173 @@
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from ccxt import InsufficientFunds
+from src.core.db import State
+from src.core.logger import logger
+from src.signal.rebalance.state_maximization import StateMaximization
+from src.utils.calc import rebalance_diff
+
+
+
+
+
+class OfflineAccount:
+    # stands in for RebalanceSingleStrategy in StateMaximization.tick,
+    # rebalances the same way and fills like MockCcxt market orders,
+    # at the close of the last kline with the taker fee
+
+    def __init__(self, quote_bal: float, base_bal: float,
+                 trading_fee: float,
+                 base_precision: float,
+                 min_trade_base: float):
+        self.quote_bal = quote_bal
+        self.base_bal = base_bal
+        self.trading_fee = trading_fee
+        self.base_precision = base_precision
+        self.min_trade_base = min_trade_base
+        self.last_price = np.nan
+        self.equity = np.nan
+
+
+    def mark(self, price: float):
+        self.last_price = price
+        self.equity = self.quote_bal + self.base_bal * self.last_price
+
+
+    def _fill(self, side: str, amount: float):
+        price = self.last_price
+        if side == 'buy':
+            cost = amount * price
+            if self.quote_bal < cost:
+                raise InsufficientFunds(f'Insufficient funds to cover {cost}/'
+                                        f'{self.quote_bal} ({price=})')
+            self.quote_bal -= cost
+            self.base_bal += amount * (1 - self.trading_fee)
+        else:
+            if self.base_bal < amount:
+                raise InsufficientFunds(f'Insufficient funds to sell {amount}/'
+                                        f'{self.base_bal} ({price=})')
+            self.base_bal -= amount
+            self.quote_bal += amount * price * (1 - self.trading_fee)
+
+
+    def rebalance(self, now: datetime, frac: float):
+        quote_invest, base_invest, diff_base = rebalance_diff(self.equity, frac,
+                                                              self.last_price,
+                                                              self.base_bal,
+                                                              self.base_precision,
+                                                              self.min_trade_base)
+
+        response = dict(
+            time=now,
+            price=self.last_price,
+            fraction=frac,
+            quote_bal=self.quote_bal,
+            base_bal=self.base_bal,
+            equity=self.equity,
+            quote_invest=quote_invest,
+            base_invest=base_invest,
+            diff_base=diff_base,
+            side=None,
+            final_quote_bal=self.quote_bal,
+            final_base_bal=self.base_bal,
+            final_equity=self.equity,
+            traded=False
+        )
+
+        if diff_base == 0:
+            return response
+
+        side = 'buy' if diff_base > 0 else 'sell'
+        self._fill(side, np.abs(diff_base))
+        self.mark(self.last_price)
+
+        response['side'] = side
+        response['final_quote_bal'] = self.quote_bal
+        response['final_base_bal'] = self.base_bal
+        response['final_equity'] = self.equity
+        response['traded'] = True
+        return response
+
+
+
+
+
+def optimize_dates(signal: StateMaximization,
+                   start_date: datetime,
+                   end_date: datetime) -> list[datetime]:
+    # dates StateMaximization optimizes at while ticking every trade_freq
+    # from start_date to end_date, starting from an empty state
+    tfdelta = signal.config.trade_freq
+    now = start_date - tfdelta
+    if signal.config.optimize_ref_date:
+        td = signal.config.opt_freq * pd.to_timedelta('1day')
+        now = signal.config.optimize_ref_date + \
+            int((now - signal.config.optimize_ref_date) / td) * td
+    
+    dates = [now]
+    for now in pd.date_range(start_date, end_date, freq=tfdelta):
+        if now >= dates[-1] + signal.config.opt_freq * tfdelta:
+            dates.append(now)
+    return dates
+
+
+
+
+
+def walk_forward(signal: StateMaximization,
+                 data: pd.DataFrame,
+                 start_date: datetime,
+                 end_date: datetime,
+                 account: OfflineAccount,
+                 state: State | None = None,
+                 parallel=True) -> pd.DataFrame:
+    """Replay the integration backtest of a StateMaximization signal on
+    a kline frame: a tick on every trade_freq from start_date to end_date
+    with the klines closed so far, followed by a re-optimization once
+    opt_freq has passed, as MockController drives a RebalanceSingleStrategy.
+    No exchange, scheduler or database is involved, data must cover
+    opt_range klines before start_date. Returns a row per tick.
+
+    An optimization only depends on its klines window, with parallel the
+    windows of every optimization date are optimized up front together
+    and the ticks only switch params."""
+    tfdelta = signal.config.trade_freq
+
+    def get_klines(limit: int, now: datetime):
+        # as DataBroker.get_klines, the last limit klines closed at now
+        return data.loc[:now - tfdelta].iloc[-limit:]
+
+    signal.inject_state(state or State())
+    signal.strategy = account
+
+    plan = None
+    if signal.config.optimize and parallel:
+        dates = optimize_dates(signal, start_date, end_date)
+        plan = dict(zip(dates, signal.optimize_windows(
+            [ (now, get_klines(signal.config.opt_range, now)) for now in dates ],
+            account.trading_fee
+        )))
+        signal.state['params'] = plan[dates[0]]
+    else:
+        signal.init_params(start_date - tfdelta, get_klines, account.trading_fee)
+
+    records = []
+    for now in pd.date_range(start_date, end_date, freq=tfdelta):
+        klines = get_klines(signal.get_length(), now)
+        account.mark(klines.iloc[-1]['close'])
+
+        frac = signal.tick(now, klines)
+        records.append(account.rebalance(now, frac))
+
+        if plan is not None:
+            if now in plan:
+                signal.state['params'] = plan[now]
+        elif signal.config.optimize:
+            signal.optimize(get_klines(signal.config.opt_range, now),
+                            account.trading_fee,
+                            now)
+
+    logger.info(f'walk forward | {len(records)} ticks from {start_date} to {end_date}')
+
+    return pd.DataFrame(records).set_index('time')
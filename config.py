@@ -22,7 +22,13 @@ API_SECRET = os.environ.get('API_SECRET')
 API_PASS = os.environ.get('API_PASS')
 
 
+# directory of the on-disk klines, fetched klines survive restarts
+KLINE_STORE = os.environ.get('KLINE_STORE') or None
+
+
 SYMBOL = 'BTC/USDT'
+# more than one symbol runs a RebalancePortfolioStrategy, e.g. ['BTC/USDT', 'ETH/USDT']
+SYMBOLS = [SYMBOL]
 
 
 TIMEFRAME = '1d'
@@ -42,9 +42,13 @@ if __name__ == '__main__':
             lastest_klines = strategy.dt.cache.iloc[-1]
             ex.__tick__(lastest_klines['close'],
                         lastest_klines['high'],
-                        lastest_klines['low'])
+                        lastest_klines['low'],
+                        volume=lastest_klines['volume'])
             controller.tick()
 
+        # orders still pending to be written
+        ex.orders.close()
+
 
 
 
@@ -2,9 +2,10 @@ from config import *
 from src.core.controller import Controller
 from src.core.logger import logger, MongoDBHandler
 from src.core.db import State
-from src.strategy.rebalance import RebalanceSingleStrategy
+from src.strategy.rebalance import RebalanceSingleStrategy, RebalancePortfolioStrategy
 from src.signal.rebalance.gcsm import GoldenCrossStateMaximization
 from traceback import format_exc
+from copy import deepcopy
 
 
 
@@ -19,12 +20,24 @@ def main():
         logger.info("Database connection OK")
 
     try:
-        signal = GoldenCrossStateMaximization(**INDICATOR_CONFIG)
-        strategy = RebalanceSingleStrategy(ex=ex,
-                                           symbol=SYMBOL,
-                                           timeframe=TIMEFRAME,
-                                           fraction=signal,
-                                           live=LIVE_TRADE)
+        if len(SYMBOLS) > 1:
+            strategy = RebalancePortfolioStrategy(
+                ex=ex,
+                symbols=SYMBOLS,
+                timeframe=TIMEFRAME,
+                fractions={ s: GoldenCrossStateMaximization(**deepcopy(INDICATOR_CONFIG))
+                            for s in SYMBOLS },
+                live=LIVE_TRADE,
+                kline_store=KLINE_STORE
+            )
+        else:
+            signal = GoldenCrossStateMaximization(**INDICATOR_CONFIG)
+            strategy = RebalanceSingleStrategy(ex=ex,
+                                               symbol=SYMBOL,
+                                               timeframe=TIMEFRAME,
+                                               fraction=signal,
+                                               live=LIVE_TRADE,
+                                               kline_store=KLINE_STORE)
         state = State(db)
         controller = Controller(TICK_SCHEDULE,
                                 { 'strategy': strategy },
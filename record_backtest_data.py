@@ -0,0 +1,15 @@
+from backtest.config import *
+from backtest.offline import record
+from src.core.data import DataBroker
+
+
+
+
+if __name__ == '__main__':
+    # public endpoints only, from the klines DataBroker can hold before
+    # start_date up to end_date
+    live = ccxt.okx({ 'enableRateLimit': True })
+    tfdelta = pd.to_timedelta(TIMEFRAME)
+    record(live, BACKTEST_DATA, [SYMBOL], TIMEFRAME,
+           start=start_date - DataBroker(live, SYMBOL, TIMEFRAME).max_length * tfdelta,
+           end=end_date + tfdelta)
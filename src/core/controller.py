@@ -48,6 +48,9 @@ class Controller:
             logger.info('no_watch mode: Tasks will run once and exit.')
 
         if state:
+            # every module's state in one round of queries
+            state.load([ f'{name}/{path}' for name, module in self.modules.items()
+                         for path in module.state_paths() ], create=False)
             for name, module in self.modules.items():
                 module.inject_state(state.sub_state(name))
     
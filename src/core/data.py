@@ -1,31 +1,50 @@
 from ccxt import Exchange
+from ccxt.async_support import Exchange as AsyncExchange
 from src.core.logger import logger
 from src.core.controller import Syncronizable
+from src.core.store import KlineStore
+from src.core.ring import KlineRing
 from src.core.timeframe import tf_to_resample
 from src.core.time import current_datetime
+from src.utils.executor import run_sync
 from datetime import datetime
 import pandas as pd
 import numpy as np
+import asyncio
 
 
 class DataBroker(Syncronizable):
     def __init__(self, ex: Exchange,
                  symbol: str, timeframe: str,
                  fill=True, include_open=False,
-                 max_length=1000) -> None:
+                 max_length=1000,
+                 store: KlineStore | None = None,
+                 page_size=100) -> None:
+        # store: closed klines are read from it first and the fetched ones
+        # appended to it, so restarts only fetch what is missing,
+        # page_size: klines requested per fetch_ohlcv
         super().__init__()
+        self.store = store
+        self.page_size = page_size
         self.symbol = symbol
         self.timeframe = timeframe
         self.tfdelta = pd.to_timedelta(timeframe)
         self.ex = ex
         self.fill = fill
-        self.cache = self._to_df()
+        self.ring = KlineRing(max_length, self.tfdelta)
         self.include_open = include_open
         self.set_max_length(max_length)
         self._start_limit = None
     
     def set_max_length(self, max_length: int):
         self.max_length = int(max_length)
+        if self.ring.capacity != self.max_length:
+            self.ring.resize(self.max_length)
+
+    @property
+    def cache(self) -> pd.DataFrame:
+        # every cached kline, a read-only view of the ring
+        return self.ring.frame(self.ring.first, len(self.ring))
     
     def round_down(self, dt):
         return pd.to_datetime(0) + \
@@ -72,21 +91,24 @@ class DataBroker(Syncronizable):
         pass
 
     def _to_df(self, data=None):
-        df = pd.DataFrame(data or [],
-                          columns=['time', 'open', 'high', 'low',
-                                   'close', 'volume'], dtype=float)
-        df['time'] = pd.to_datetime(df['time']*1000000)
-        df.set_index('time', inplace=True)
+        data = np.asarray(data or [], dtype=float).reshape(-1, 6)
+        df = pd.DataFrame(data[:, 1:],
+                          columns=['open', 'high', 'low',
+                                   'close', 'volume'],
+                          index=pd.DatetimeIndex(pd.to_datetime(data[:, 0]*1000000),
+                                                 name='time'))
         return df.resample(self.tfdelta).last()
 
-    def get(self, limit: int | None = None,
-            start: datetime | None = None,
-            last: datetime | None = None,
-            end: datetime | None = None):
+    def _query(self, limit: int | None,
+               start: datetime | None,
+               last: datetime | None,
+               end: datetime | None):
+        # validate a query and resolve it against the cache, returns the
+        # requested (start_, limit_) and the missing (start__, limit__)
         logger.debug(f'data | cache range: '
-                     f'{self.cache.index[0] if len(self.cache) > 0 else None} '
-                     f'{self.cache.index[-1] if len(self.cache) > 0 else None} '
-                     f'freq: {self.cache.index.freq}')
+                     f'{self.ring.first} '
+                     f'{self.ring.end} '
+                     f'length: {len(self.ring)}')
         logger.debug(f'data | query '
                      f'{limit=} '
                      f'{start=} '
@@ -117,41 +139,87 @@ class DataBroker(Syncronizable):
 
         start__, limit__ = start_, limit_
 
-        if (len(self.cache) > 0 and \
-            self.cache.index[0] <= start__):
-            limit__ = limit__ - len(self.cache.loc[start__:].iloc[:limit])
-            start__ = np.max([self.cache.index[-1] + self.cache.index.freq, start__])
+        if (len(self.ring) > 0 and \
+            self.ring.first <= start__):
+            limit__ = limit__ - len(self.ring.view(start__, limit__)[1])
+            start__ = np.max([self.ring.end, start__])
         else:
-            self.cache = self._to_df()
+            self.ring.clear()
             logger.debug(f'data | reset cache')
 
         logger.debug(f'data | query '
                      f'{limit__=} '
                      f'{start__=} ')
 
-        df = self._to_df()
+        return start_, limit_, start__, limit__
+
+    def _read_store(self, start__: datetime, limit__: int):
+        # the stored klines of the missing range and what remains missing
+        if self.store is None or limit__ <= 0:
+            return [], start__, limit__
+
+        df = self.store.read(start__, limit__)
+        if len(df) == 0:
+            return [], start__, limit__
+        logger.debug(f'data | klines from store from: {df.index[0]} to: {df.index[-1]} ({limit__})')
+        return [df], start__ + len(df) * self.tfdelta, limit__ - len(df)
+
+    def _write_store(self, fetched: list[pd.DataFrame]):
+        if self.store is not None and fetched:
+            # only closed klines are final
+            df = pd.concat(fetched).resample(self.tfdelta).last()
+            self.store.append(df.loc[:current_datetime() - self.tfdelta])
+
+    def _update(self, dfs: list[pd.DataFrame], start_: datetime, limit_: int):
+        # only new klines are merged, the result is a view of the ring
+        dfs = [ df for df in dfs if len(df) > 0 ]
+        if dfs:
+            self.ring.write(pd.concat(dfs).resample(self.tfdelta).last())
+
+        return self.ring.frame(start_, limit_)
+
+    def get(self, limit: int | None = None,
+            start: datetime | None = None,
+            last: datetime | None = None,
+            end: datetime | None = None):
+        start_, limit_, start__, limit__ = self._query(limit, start, last, end)
+        stored, start__, limit__ = self._read_store(start__, limit__)
+
+        fetched = []
+        skipped = False
 
         while limit__ > 0:
+            limit = min(limit__, self.page_size)
             _df = self.ex.fetch_ohlcv(self.symbol, self.timeframe,
                                       since=int(start__.timestamp() * 1000),
-                                      limit=limit__)
+                                      limit=limit)
             _df = self._to_df(_df)
 
             if len(_df) > 0:
                 logger.debug(f'data | klines updated from: {_df.index[0]} to: {_df.index[-1]} ({limit__})')
-            else:
-                self._start_limit = df.index[0]
+            elif fetched:
+                # the newest klines are not out yet
                 logger.warning(f'data | no klines updated ({limit__}) {self._start_limit=}')
                 break
+            else:
+                # none opened in the page, it is before the listing
+                skipped = True
+                start__ += limit * self.tfdelta
+                limit__ -= limit
+                continue
 
-            df = pd.concat([_df, df])
-            limit__ -= len(_df)
+            if skipped and not fetched:
+                self._start_limit = _df.index[0]
+                logger.warning(f'data | no klines before {self._start_limit=}')
 
-        self.cache = pd.concat([self.cache, df])
+            fetched.append(_df)
+            # the exchange may cap the page, the next one starts after it
+            limit__ -= int((_df.index[-1] + self.tfdelta - start__) / self.tfdelta)
+            start__ = _df.index[-1] + self.tfdelta
 
-        self.cache = self.cache.iloc[-self.max_length:].resample(self.tfdelta).last()
+        self._write_store(fetched)
 
-        return self.cache.loc[start_:].iloc[:limit_]
+        return self._update(stored + fetched, start_, limit_)
 
 
 
@@ -167,3 +235,86 @@ class DataBroker(Syncronizable):
 
 
 
+
+
+
+
+class AsyncDataBroker(DataBroker):
+    """DataBroker on a ccxt.async_support exchange. The missing range of a
+    query is split into pages of page_size klines which are requested
+    concurrently, at most max_concurrency at a time and paced by the
+    exchange's own rate limiter (enableRateLimit), then merged in order.
+
+    aget() is the coroutine, get() and the other DataBroker methods are a
+    sync facade running it on the shared event loop of src.utils.executor,
+    so the exchange must only be used through it."""
+
+    def __init__(self, ex: AsyncExchange,
+                 symbol: str, timeframe: str,
+                 fill=True, include_open=False,
+                 max_length=1000,
+                 page_size=100,
+                 max_concurrency=8,
+                 store: KlineStore | None = None) -> None:
+        super().__init__(ex, symbol, timeframe,
+                         fill=fill,
+                         include_open=include_open,
+                         max_length=max_length,
+                         store=store,
+                         page_size=page_size)
+        self.max_concurrency = max_concurrency
+
+    async def _fetch_page(self, semaphore: asyncio.Semaphore,
+                          since: datetime, limit: int):
+        # the exchange may cap a page below limit, the rest of it is then
+        # fetched from after the last returned kline until a page is empty
+        dfs = []
+        async with semaphore:
+            while limit > 0:
+                df = self._to_df(await self.ex.fetch_ohlcv(self.symbol, self.timeframe,
+                                                           since=int(since.timestamp() * 1000),
+                                                           limit=limit))
+                if len(df) == 0:
+                    break
+                dfs.append(df)
+                limit -= int((df.index[-1] + self.tfdelta - since) / self.tfdelta)
+                since = df.index[-1] + self.tfdelta
+        return pd.concat(dfs) if len(dfs) > 1 else dfs[0] if dfs else self._to_df()
+
+    async def aget(self, limit: int | None = None,
+                   start: datetime | None = None,
+                   last: datetime | None = None,
+                   end: datetime | None = None):
+        start_, limit_, start__, limit__ = self._query(limit, start, last, end)
+        stored, start__, limit__ = self._read_store(start__, limit__)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pages = await asyncio.gather(*[
+            self._fetch_page(semaphore,
+                             start__ + i * self.tfdelta,
+                             min(self.page_size, limit__ - i))
+            for i in range(0, max(limit__, 0), self.page_size)
+        ])
+
+        fetched = [ p for p in pages if len(p) > 0 ]
+        if fetched:
+            logger.debug(f'data | klines updated from: {fetched[0].index[0]} to: {fetched[-1].index[-1]} '
+                         f'({limit__} in {len(pages)} pages)')
+        if len(fetched) < len(pages):
+            if fetched and len(pages[0]) == 0:
+                self._start_limit = fetched[0].index[0]
+            logger.warning(f'data | {len(pages) - len(fetched)}/{len(pages)} pages '
+                           f'without klines ({limit__}) {self._start_limit=}')
+
+        self._write_store(fetched)
+
+        return self._update(stored + fetched, start_, limit_)
+
+    def get(self, limit: int | None = None,
+            start: datetime | None = None,
+            last: datetime | None = None,
+            end: datetime | None = None):
+        return run_sync(self.aget(limit, start=start, last=last, end=end))
+
+    def close(self):
+        run_sync(self.ex.close())
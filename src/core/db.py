@@ -1,6 +1,9 @@
+from pymongo import InsertOne
 from pymongo.database import Database
+from bson import ObjectId
 from datetime import datetime
 from src.core.time import current_datetime
+from src.utils.executor import get_threads
 
 
 
@@ -42,6 +45,12 @@ class KeyRef:
 
 
 
+# collections whose index this process already ensured
+_indexed: set[str] = set()
+
+
+
+
 class State:
     def __init__(self, db: Database | None = None,
                  initial_paths: list[str] = None,
@@ -54,6 +63,10 @@ class State:
 
         self.store: dict[str, dict | None] = {}
         self.children: dict[str, State] = {}
+        # paths set since they were last saved or loaded
+        self.dirty: set[str] = set()
+        # paths known not to be in the database
+        self.missing: set[str] = set()
 
         if parent is None:
             self.abs_path = '/'
@@ -114,6 +127,8 @@ class State:
 
 
     def load(self, paths: list[str] | str | None=None, replace: bool | str=False, create=True):
+        # the latest documents of paths, queried together. Unless replaced,
+        # paths already in memory or known missing are not queried again.
         if paths is None:
             return
         
@@ -123,17 +138,18 @@ class State:
             paths = [paths]
         
         now = current_datetime()
-        for path in paths:
-            target, path, abs_path = self._get_target_utils(path)
-
-            _res = []
-            if self.db is not None:
-                _res = self.db[abs_path].find().sort("__updated_time__", -1).limit(1)
+        targets = [ self._get_target_utils(path) for path in paths ]
+        query = [ abs_path for target, path, abs_path in targets
+                  if replace or not (target.store.get(path) or path in target.missing) ]
+        found = dict(zip(query, self._latest(query)))
+
+        for target, path, abs_path in targets:
+            res = found.get(abs_path)
+            if abs_path in found and res is None:
+                target.missing.add(path)
             
-            res = { '__updated_time__': now } if create else None
-            for r in _res:
-                res = r
-                break
+            if res is None:
+                res = { '__updated_time__': now } if create else None
             
             if res is None:
                 continue
@@ -143,9 +159,29 @@ class State:
             else:
                 if replace == True or replace == 'force':
                     target[path] = res
-                if replace == 'new' and \
+                elif replace == 'new' and \
                     target[path]['__updated_time__'] < res['__updated_time__']:
                     target[path] = res
+                else:
+                    continue
+            if '_id' in res:
+                # as saved, a path created here is saved once
+                target.dirty.discard(path)
+
+
+    def _latest(self, abs_paths: list[str]) -> list[dict | None]:
+        # latest document of each collection, fetched concurrently
+        if self.db is None:
+            return [ None ] * len(abs_paths)
+
+        def latest(abs_path):
+            for r in self.db[abs_path].find().sort("__updated_time__", -1).limit(1):
+                return r
+            return None
+
+        if len(abs_paths) < 2:
+            return list(map(latest, abs_paths))
+        return list(get_threads().map(latest, abs_paths))
     
 
     def _acquire_key_ref(self, value: dict, stack=None):
@@ -184,48 +220,52 @@ class State:
 
 
     def save(self, key=None, paths: list[str] | None=None, recursive=True):
+        # insert the paths set since the last save (or the given paths) of
+        # this state, and of its children when recursive, with one bulk
+        # write per collection
+        writes: dict[str, tuple] = {}
+        saved: list[tuple[State, str]] = []
+        self._collect(key, paths, recursive, writes, saved)
+
+        for col, docs in writes.values():
+            if col.full_name not in _indexed:
+                col.create_index([("__updated_time__", -1)])
+                _indexed.add(col.full_name)
+            col.bulk_write([ InsertOne(doc) for doc in docs ])
+
+        for target, path in saved:
+            target.dirty.discard(path)
+
+
+    def _collect(self, key, paths: list[str] | None, recursive: bool,
+                 writes: dict[str, tuple], saved: list):
         if paths is None and recursive:
             for child in self.children.values():
-                child.save(key, recursive=True)
+                child._collect(key, None, True, writes, saved)
 
         self._validate_db()
         if self.db is None:
             return
-        
-        key_refs = []
-        for path in paths or self.store:
-            target, path, abs_path = self._get_target_utils(path)
-            _key_refs, value = self._acquire_key_ref(target[path])
-            
-            key_refs.append((path, _key_refs))
 
-            obj = {}
-            obj["__save_from__"] = self.abs_path
-            if key is not None:
-                obj["__key__"] = key
+        if paths is None:
+            paths = [ path for path in self.store if path in self.dirty ]
+        targets = [ self._get_target_utils(path) for path in paths ]
 
-            col = target.db[abs_path]
-            obj = { **obj, **value }
-            if '_id' in obj:
-                del obj['_id']
-            _id = col.insert_one(obj).inserted_id
-            target[path]['_id'] = _id
-            col.create_index([("__updated_time__", -1)])
-        
-        
-        for path, stacks in key_refs:
-            target, path, abs_path = self._get_target_utils(path)
-            target_obj = target[path]
+        # ids first, a KeyRef may point at the _id of any of them
+        for target, path, _ in targets:
+            target[path]['_id'] = ObjectId()
 
+        for target, path, abs_path in targets:
+            target_obj = target[path]
+            stacks, _ = self._acquire_key_ref(target_obj)
             for stack in stacks:
                 t = target_obj
                 for s in stack[:-1]:
                     t = t[s]
-                # print(t)
                 key_ref = t[stack[-1]]
 
                 _target, _path, _ = \
-                    self._get_target_utils(key_ref.path or path)
+                    target._get_target_utils(key_ref.path or path)
                 
                 val = _target[_path]
                 for k in key_ref.keys:
@@ -234,12 +274,15 @@ class State:
                     val = key_ref._apply(val)
                 t[stack[-1]] = val
 
-            target_obj = {**target_obj}
-            _id = target_obj['_id']
-            del target_obj['_id']
+            obj = {}
+            obj["__save_from__"] = self.abs_path
+            if key is not None:
+                obj["__key__"] = key
 
-            col.update_one({ '_id': _id },
-                           { '$set': target_obj })
+            if abs_path not in writes:
+                writes[abs_path] = (target.db[abs_path], [])
+            writes[abs_path][1].append({ **obj, **target_obj })
+            saved.append((target, path))
             
             
     def sub_state(self, name: str | None = None,
@@ -272,7 +315,7 @@ class State:
         if target != self:
             return path.split('/')[-1] in target
         
-        if path not in self.store:
+        if path not in self.store and path not in self.missing:
             self.load(path, create=False)
         return path in self.store
 
@@ -282,7 +325,7 @@ class State:
         if target != self:
             return target[path.split('/')[-1]]
 
-        if path not in self.store:
+        if path not in self.store and path not in self.missing:
             self.load(path, create=False)
         if path not in self.store:
             raise KeyError(f'{self.abs_path} + {path}')
@@ -298,6 +341,8 @@ class State:
         if type(value) != dict:
             raise ValueError('value is not a dict')
         self.store[path] = { '__updated_time__': current_datetime(), **value}
+        self.dirty.add(path)
+        self.missing.discard(path)
         
 
     def __delitem__(self, path: str):
@@ -310,6 +355,8 @@ class State:
         if self.db is not None:
             self.db[abs_path].drop()
         del self.store[path]
+        self.dirty.discard(path)
+        self.missing.add(path)
 
     
     def ls(self):
@@ -328,5 +375,10 @@ class StateInjectable:
     def __init__(self, state: State | None = None) -> None:
         self.state = state
     
+    def state_paths(self) -> list[str]:
+        # paths of its state inject_state loads, relative to that state, for
+        # them to be loaded together beforehand
+        return []
+    
     def inject_state(self, state: State):
         self.state = state
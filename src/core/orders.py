@@ -0,0 +1,73 @@
+from concurrent.futures import Executor
+from time import monotonic, sleep
+import ccxt
+from src.core.logger import logger
+
+
+
+
+class OrderTimeout(ccxt.RequestTimeout):
+    def __init__(self, message: str, pending: list[dict]) -> None:
+        super().__init__(message)
+        # last known state of the orders not closed yet
+        self.pending = pending
+
+
+
+
+class OrderTracker:
+    """Waits for orders to be closed. The orders still pending are fetched
+    together, right away and then after each delay of backoff (seconds, the
+    last one repeating), so a fill is seen as soon as the schedule allows
+    without a fixed poll interval. Raises OrderTimeout once deadline seconds
+    passed and ccxt.OrderNotFillable for an order canceled, expired or
+    rejected. With an executor the orders are fetched concurrently."""
+
+    failed = ('canceled', 'expired', 'rejected')
+
+    def __init__(self, ex: ccxt.Exchange,
+                 backoff: tuple[float, ...] = (0.1, 0.2, 0.5, 1.0, 2.0),
+                 deadline: float = 60.0,
+                 executor: Executor | None = None) -> None:
+        self.ex = ex
+        self.backoff = backoff
+        self.deadline = deadline
+        self.executor = executor
+
+    def _fetch(self, orders: list[dict]) -> list[dict]:
+        def fetch(order):
+            return self.ex.fetch_order(order['id'], order['symbol'])
+        if self.executor is None or len(orders) < 2:
+            return list(map(fetch, orders))
+        return list(self.executor.map(fetch, orders))
+
+    def wait(self, orders: list[dict]) -> list[dict]:
+        # the closed orders, in the order of orders
+        start = monotonic()
+        delays = iter(self.backoff)
+        delay = 0
+        closed: dict[str, dict] = {}
+        polls = 0
+
+        while True:
+            pending = [ o for o in orders if o['id'] not in closed ]
+            fetched = self._fetch(pending)
+            polls += 1
+            for o in fetched:
+                if o['status'] == 'closed':
+                    closed[o['id']] = o
+                elif o['status'] in self.failed:
+                    raise ccxt.OrderNotFillable(f'order {o["id"]} {o["status"]}')
+
+            if len(closed) == len(orders):
+                logger.debug(f'orders | {len(orders)} closed in '
+                             f'{monotonic() - start:.2f}s ({polls} polls)')
+                return [ closed[o['id']] for o in orders ]
+
+            remaining = self.deadline - (monotonic() - start)
+            if remaining <= 0:
+                raise OrderTimeout(f'{len(orders) - len(closed)}/{len(orders)} orders '
+                                   f'not closed after {self.deadline}s',
+                                   [ o for o in fetched if o['id'] not in closed ])
+            delay = next(delays, delay)
+            sleep(min(delay, remaining))
@@ -0,0 +1,109 @@
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+
+
+
+class KlineRing:
+    """Fixed capacity buffer of the latest klines, OHLCV columns of float64
+    rows addressed by bar number from the first bar.
+
+    The ring is unrolled into an array of twice the capacity: bars are
+    appended after the last one and once the array is full the latest
+    capacity rows move to a new array, so appends cost O(new bars) amortized
+    and any range of bars is a contiguous slice. Rows of an array are never
+    written twice, the read-only views frame() returns stay valid after
+    later writes."""
+
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, capacity: int, tfdelta: pd.Timedelta) -> None:
+        self.capacity = int(capacity)
+        self.tfdelta = pd.to_timedelta(tfdelta)
+        self.clear()
+
+    def clear(self):
+        self._values = np.empty((2 * self.capacity, len(self.columns)))
+        self._lo = self._hi = 0
+        # time of the bar at row _lo
+        self.first: pd.Timestamp | None = None
+
+    def __len__(self):
+        return self._hi - self._lo
+
+    @property
+    def end(self) -> pd.Timestamp | None:
+        # time of the bar after the last one
+        return None if self.first is None else self.first + len(self) * self.tfdelta
+
+    def bar(self, time: datetime) -> int:
+        # bar number of time, 0 being the first bar
+        return int((pd.Timestamp(time) - self.first) // self.tfdelta)
+
+    def resize(self, capacity: int):
+        latest = self.frame(self.first, len(self)) if len(self) > 0 else None
+        self.capacity = int(capacity)
+        self.clear()
+        if latest is not None:
+            self.write(latest)
+
+    def _push(self, values: np.ndarray):
+        n = len(values)
+        if self._hi + n > len(self._values):
+            keep = min(len(self), self.capacity - n)
+            moved = np.empty_like(self._values)
+            moved[:keep] = self._values[self._hi - keep:self._hi]
+            self.first += (len(self) - keep) * self.tfdelta
+            self._values, self._lo, self._hi = moved, 0, keep
+        self._values[self._hi:self._hi + n] = values
+        self._hi += n
+        if len(self) > self.capacity:
+            self.first += (len(self) - self.capacity) * self.tfdelta
+            self._lo = self._hi - self.capacity
+
+    def write(self, df: pd.DataFrame):
+        # df: klines on consecutive bars (as resampled), bars already in the
+        # buffer are replaced, bars between the last one and df are NaN
+        if len(df) == 0:
+            return
+        values = df[self.columns].to_numpy(dtype=float)
+
+        if len(self) > 0 and df.index[0] < self.end:
+            # rewrites buffered bars, into a new array not to alter views
+            latest = self.frame(self.first, len(self))
+            merged = pd.concat([latest, df]).resample(self.tfdelta).last()
+            self.clear()
+            self.write(merged)
+            return
+
+        if len(self) == 0 or len(values) >= self.capacity or \
+                df.index[0] - self.end >= self.capacity * self.tfdelta:
+            # none of the buffered bars stay
+            values = values[-self.capacity:]
+            self.clear()
+            self.first = df.index[-len(values)]
+        else:
+            gap = self.bar(df.index[0]) - len(self)
+            if gap > 0:
+                self._push(np.full((gap, len(self.columns)), np.nan))
+
+        self._push(values)
+
+    def view(self, start: datetime, limit: int) -> tuple[pd.Timestamp, np.ndarray]:
+        # (time of the first row, read-only rows) of the buffered bars
+        # in [start, start + limit)
+        if len(self) == 0:
+            return None, self._values[:0]
+        i = max(self.bar(start), 0)
+        j = min(max(self.bar(start) + limit, i), len(self))
+        rows = self._values[self._lo + i:self._lo + j]
+        rows.flags.writeable = False
+        return self.first + i * self.tfdelta, rows
+
+    def frame(self, start: datetime, limit: int) -> pd.DataFrame:
+        # view() as a DataFrame sharing its memory
+        first, rows = self.view(start, limit)
+        index = pd.date_range(first, periods=len(rows), freq=self.tfdelta, name='time') \
+            if first is not None else pd.DatetimeIndex([], name='time', freq=self.tfdelta)
+        return pd.DataFrame(rows, index=index, columns=self.columns, copy=False)
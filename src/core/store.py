@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+from datetime import datetime
+from src.core.logger import logger
+import pandas as pd
+import numpy as np
+import fcntl
+import json
+import os
+import uuid
+
+
+
+
+class KlineStore:
+    """Append only on-disk klines of one (exchange, symbol, timeframe).
+
+    Bars are float64 rows of OHLCV in a memory-mapped file, row i being the
+    bar opened at start + i * timeframe. Only runs of complete bars joined to
+    the stored ones are kept, a missing bar is left to be fetched again.
+    A small json meta file names the data file and how many rows of it are
+    committed. Writers append rows past the committed count, fsync, then
+    atomically replace the meta file, so readers, which only map the rows
+    the meta names, never see a partial write. Bars before start rewrite the
+    data into a new file committed the same way. Writers of different
+    processes are serialized by a lock file."""
+
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, root: str, exchange: str,
+                 symbol: str, timeframe: str) -> None:
+        self.dir = os.path.join(root, exchange, symbol.replace('/', '-'), timeframe)
+        self.tfdelta = pd.to_timedelta(timeframe)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _path(self, name: str):
+        return os.path.join(self.dir, name)
+
+    def _meta(self) -> dict | None:
+        try:
+            with open(self._path('meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _commit(self, meta: dict):
+        tmp = self._path(f'meta.{uuid.uuid4().hex}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path('meta.json'))
+
+    @contextmanager
+    def _lock(self):
+        with open(self._path('lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def span(self) -> tuple[pd.Timestamp | None, int]:
+        # (first bar, number of bars) committed
+        meta = self._meta()
+        if meta is None:
+            return None, 0
+        return pd.to_datetime(meta['start'], unit='ms'), meta['count']
+
+    def read(self, start: datetime, limit: int) -> pd.DataFrame:
+        # the stored bars of [start, start + limit), only the leading run
+        # of them if the store ends within the range
+        for _ in range(3):
+            meta = self._meta()
+            if meta is None:
+                break
+            first = pd.to_datetime(meta['start'], unit='ms')
+            i = int((pd.Timestamp(start) - first) / self.tfdelta)
+            if i < 0 or i >= meta['count']:
+                break
+            n = min(limit, meta['count'] - i)
+            try:
+                rows = np.memmap(self._path(meta['file']), dtype=np.float64, mode='r',
+                                 shape=(meta['count'], len(self.columns)))
+            except FileNotFoundError:
+                # rewritten since the meta was read
+                continue
+            values = np.array(rows[i:i + n])
+            del rows
+            index = pd.date_range(first + i * self.tfdelta, periods=n,
+                                  freq=self.tfdelta, name='time')
+            return pd.DataFrame(values, index=index, columns=self.columns)
+        return pd.DataFrame(columns=self.columns, dtype=float,
+                            index=pd.DatetimeIndex([], name='time', freq=self.tfdelta))
+
+    def _run(self, df: pd.DataFrame, start=None, last=None) -> pd.DataFrame:
+        # the bars of df (complete ones) from start, or up to last, until
+        # the first one missing
+        if len(df) == 0 or (start is not None and df.index[-1] < start) or \
+                (last is not None and df.index[0] > last):
+            return df.iloc[:0]
+        index = pd.date_range(df.index[0] if start is None else start,
+                              df.index[-1] if last is None else last,
+                              freq=self.tfdelta)
+        missing = ~index.isin(df.index)
+        if start is not None:
+            n = missing.argmax() if missing.any() else len(index)
+            return df.reindex(index[:n])
+        n = missing[::-1].argmax() if missing.any() else len(index)
+        return df.reindex(index[len(index) - n:])
+
+    def append(self, df: pd.DataFrame):
+        # store the bars of df (time indexed OHLCV) that are not stored yet,
+        # stored bars are never overwritten
+        df = df[self.columns].astype(float)
+        df = df[df.notna().all(axis=1)]
+        if len(df) == 0:
+            return
+
+        with self._lock():
+            meta = self._meta()
+            if meta is None:
+                self._rewrite(self._run(df, start=df.index[0]), None)
+                return
+
+            first = pd.to_datetime(meta['start'], unit='ms')
+            end = first + meta['count'] * self.tfdelta
+            new = self._run(df, start=end)
+            if df.index[0] < first:
+                head = self._run(df.loc[:first - self.tfdelta], last=first - self.tfdelta)
+                if len(head) > 0:
+                    self._rewrite(head, meta, new)
+                    return
+
+            if len(new) == 0:
+                return
+            with open(self._path(meta['file']), 'r+b') as f:
+                f.seek(meta['count'] * len(self.columns) * 8)
+                f.write(np.ascontiguousarray(new.to_numpy(), dtype=np.float64).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            self._commit({ **meta, 'count': meta['count'] + len(new) })
+            logger.debug(f'store | appended {len(new)} klines to {self.dir}')
+
+    def _rewrite(self, df: pd.DataFrame, meta: dict | None,
+                 tail: pd.DataFrame | None = None):
+        # df, then the stored bars and tail after them, into a new file
+        if meta is not None:
+            first, count = self.span()
+            df = pd.concat([df, self.read(first, count), tail])
+
+        file = f'klines.{uuid.uuid4().hex}.bin'
+        with open(self._path(file), 'wb') as f:
+            f.write(np.ascontiguousarray(df.to_numpy(), dtype=np.float64).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._commit({ 'file': file,
+                       'start': int(df.index[0].value // 10**6),
+                       'count': len(df) })
+        if meta is not None:
+            # readers still mapping it keep it until they are done
+            os.remove(self._path(meta['file']))
+        logger.debug(f'store | wrote {len(df)} klines to {self.dir}')
@@ -2,7 +2,9 @@ from pydantic import BaseModel, conint, Field
 from typing import Literal, List, Any
 import pandas as pd
 import numpy as np
-from .state_maximization import KlineStateTemplate, StateMaximization
+from collections import deque
+from itertools import islice
+from .state_maximization import KlineStateTemplate, KlineStateUpdater, StateMaximization
 
 
 
@@ -30,6 +32,66 @@ class GcKlineStateConfig(BaseModel):
 
 
 
+class WindowedEwm:
+    # pandas ewm(span).mean() (adjust=True) of a sliding kline buffer
+    def __init__(self, span: int, values: np.ndarray) -> None:
+        self.decay = 1 - 2 / (span + 1)
+        self.acc = deque()
+        self.acc_before = 0.0
+        for x in values:
+            self.push(x)
+    
+    def push(self, x: float):
+        self.acc.append(self.decay * (self.acc[-1] if self.acc else self.acc_before) + x)
+    
+    def pop(self):
+        self.acc_before = self.acc.popleft()
+    
+    def mean(self, length: int, first: float = 0.0) -> np.ndarray:
+        # first: amount to take out of the first buffered value
+        n = len(self.acc)
+        k = np.arange(n - length + 1, n + 1)
+        acc = np.fromiter(islice(reversed(self.acc), length), dtype=float, count=length)[::-1]
+        num = acc - self.decay ** k * self.acc_before - self.decay ** (k - 1) * first
+        den = (1 - self.decay ** k) / (1 - self.decay)
+        return num / den
+
+
+
+class GcKlineStateUpdater(KlineStateUpdater):
+    def __init__(self, data: pd.DataFrame, config: GcKlineStateConfig) -> None:
+        self.config = config
+        values = data[config.state_target].to_numpy(dtype=float)
+        self.values = deque(values)
+        self.ema_fast = WindowedEwm(config.ema_fast_length, values)
+        self.ema_slow = WindowedEwm(config.ema_slow_length, values)
+    
+    def update(self, row: dict):
+        x = row[self.config.state_target]
+        self.values.append(x)
+        self.ema_fast.push(x)
+        self.ema_slow.push(x)
+    
+    def drop(self):
+        self.values.popleft()
+        self.ema_fast.pop()
+        self.ema_slow.pop()
+    
+    def window(self, length: int) -> dict[str, np.ndarray]:
+        # get() sees a zero return for the first kline of the buffer
+        first = self.values[0] if self.config.state_target == 'ret' else 0.0
+        ema_fast = self.ema_fast.mean(length, first)
+        ema_slow = self.ema_slow.mean(length, first)
+        return {
+            'ema_fast': ema_fast,
+            'ema_slow': ema_slow,
+            'state': (ema_fast > ema_slow) * 1
+        }
+
+
+
+
+
 class GcKlineState(KlineStateTemplate):
     def __init__(self, buffer_safety_factor=5) -> None:
         self.buffer_safety_factor = buffer_safety_factor
@@ -42,6 +104,10 @@ class GcKlineState(KlineStateTemplate):
         return data
     
 
+    def get_updater(self, data: pd.DataFrame, **config) -> GcKlineStateUpdater:
+        return GcKlineStateUpdater(data, GcKlineStateConfig(**config))
+    
+
     def get_length(self,
                    config_space: GcKlineStateConfigSpace | dict[str, List[Any]]) -> int:
         config_space = GcKlineStateConfigSpace(**config_space)
@@ -22,9 +22,13 @@ class GoldenCross(RebalanceSignal):
         self.config = config
     
     
+    def state_paths(self) -> list[str]:
+        return ['state']
+    
+    
     def inject_state(self, state: State):
         super().inject_state(state)
-        self.state.load('state')
+        self.state.load(self.state_paths())
 
 
     def get_length(self) -> timedelta | int:
@@ -2,7 +2,9 @@ from pydantic import BaseModel, conint
 from typing import Literal, List, Any
 import pandas as pd
 import numpy as np
-from .state_maximization import KlineStateTemplate, StateMaximization
+from collections import deque
+from itertools import islice
+from .state_maximization import KlineStateTemplate, KlineStateUpdater, StateMaximization
 from src.utils.backtest.data import make_time_window
 
 
@@ -33,6 +35,57 @@ class QqKlineStateConfig(BaseModel):
 
 
 
+class QqKlineStateUpdater(KlineStateUpdater):
+    def __init__(self, data: pd.DataFrame, config: QqKlineStateConfig) -> None:
+        self.config = config
+        self.values = deque(data[config.state_target].iloc[-config.qt_length:],
+                            maxlen=config.qt_length)
+        self.uni_states = deque(data['uni_state'])
+        self.states = deque(data['state'])
+        self.base = np.power(config.qt_steps + 1,
+                             np.arange(config.chain_length)[::-1])
+        # klines at the start of the buffer whose state get() would derive
+        # from a partial rolling window
+        self.warmup = config.qt_length + config.chain_length - 1
+    
+    def update(self, row: dict):
+        x = row[self.config.state_target]
+        self.values.append(x)
+
+        values = np.array(self.values, dtype=float)
+        if len(values) < self.config.qt_length or np.isnan(values).any():
+            uni_state = np.nan
+        else:
+            # rolling rank (method='average') of the last value
+            rank = (values < x).sum() + ((values == x).sum() + 1) / 2
+            uni_state = np.round(rank * self.config.qt_steps / self.config.qt_length)
+        self.uni_states.append(uni_state)
+
+        if len(self.uni_states) < self.config.chain_length:
+            state = np.nan
+        else:
+            chain = np.fromiter(islice(reversed(self.uni_states), self.config.chain_length),
+                                dtype=float, count=self.config.chain_length)[::-1]
+            state = (chain * self.base).sum()
+        self.states.append(state)
+    
+    def drop(self):
+        self.uni_states.popleft()
+        self.states.popleft()
+    
+    def window(self, length: int) -> dict[str, np.ndarray] | None:
+        if length > len(self.states) - self.warmup:
+            return None
+        tail = lambda d: np.fromiter(islice(reversed(d), length), dtype=float, count=length)[::-1]
+        return {
+            'uni_state': tail(self.uni_states),
+            'state': tail(self.states)
+        }
+
+
+
+
+
 class QqKlineState(KlineStateTemplate):
     def get(self, data: pd.DataFrame, **config) -> pd.DataFrame:
         config = QqKlineStateConfig(**config)
@@ -50,6 +103,10 @@ class QqKlineState(KlineStateTemplate):
         return data
     
 
+    def get_updater(self, data: pd.DataFrame, **config) -> QqKlineStateUpdater:
+        return QqKlineStateUpdater(data, QqKlineStateConfig(**config))
+    
+
     def get_length(self,
                    config_space: QqKlineStateConfigSpace | dict[str, List[Any]]) -> int:
         config_space = QqKlineStateConfigSpace(**config_space)
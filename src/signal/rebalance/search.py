@@ -0,0 +1,125 @@
+from typing import Any, Callable, Iterator
+import pandas as pd
+import numpy as np
+from src.core.logger import logger
+
+
+
+# evaluate(space, data, start=None) yields (params, report) for every params
+# of space, weighted on the whole data and scored from start on
+Evaluate = Callable[..., Iterator[tuple[dict, Any]]]
+
+
+
+def _key(params: dict):
+    return tuple(sorted(params.items()))
+
+
+def _rank(results: list[tuple[dict, Any]], score: Callable[[Any], float],
+          order: dict[tuple, int]):
+    # best first, nan scores last, ties in space order
+    def key(x):
+        s = score(x[1])
+        return -np.inf if s is None or np.isnan(s) else s
+    return sorted(results, key=lambda x: (-key(x), order[_key(x[0])]))
+
+
+
+
+
+class SearchStrategy:
+    def search(self, space: list[dict], data: pd.DataFrame,
+               evaluate: Evaluate,
+               score: Callable[[Any], float]) -> Iterator[tuple[dict, Any]]:
+        # yields the (params, report) on the whole data to pick the best from
+        raise NotImplementedError()
+
+
+
+class ExhaustiveSearch(SearchStrategy):
+    def search(self, space, data, evaluate, score):
+        yield from evaluate(space, data)
+
+
+
+class SuccessiveHalvingSearch(SearchStrategy):
+    """Score every combo on the most recent part of the history, keep the
+    best 1/rate of them for a rate times longer history, and so on until the
+    survivors are scored on the whole history. Weights always see the whole
+    history, min_length only bounds the scored part."""
+
+    def __init__(self, rate: int = 3, min_length: int = 2) -> None:
+        self.rate = rate
+        self.min_length = min_length
+    
+    def search(self, space, data, evaluate, score):
+        order = { _key(p): i for i, p in enumerate(space) }
+        # no more rounds than needed to get down to one combo, nor than
+        # the history allows above min_length
+        rounds = int(np.floor(min(
+            np.log(len(space)),
+            np.log(max(len(data) / self.min_length, 1))
+        ) / np.log(self.rate)))
+        if rounds == 0 and len(space) > 1:
+            logger.warning(f'search | halving has no round with {len(space)} combos, '
+                           f'{len(data)} klines and {self.min_length=}, '
+                           f'every combo is scored on the whole history')
+
+        candidates = space
+        for i in range(rounds):
+            length = max(int(len(data) / self.rate ** (rounds - i)), self.min_length)
+            results = _rank(evaluate(candidates, data, data.index[-length]), score, order)
+            keep = int(np.ceil(len(results) / self.rate))
+            candidates = [ p for p, _ in results[:keep] ]
+
+        yield from evaluate(candidates, data)
+
+
+
+class ModelBasedSearch(SearchStrategy):
+    """Evaluate a fixed budget of combos, first at random, then in batches
+    picked by a per-param density ratio of the best quarter of the scored
+    combos against all of them (tree-structured Parzen estimator style)."""
+
+    def __init__(self, budget: int, batch_size: int = 8,
+                 gamma: float = 0.25, seed: int = 42) -> None:
+        self.budget = budget
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.seed = seed
+    
+    def search(self, space, data, evaluate, score):
+        rs = np.random.RandomState(self.seed)
+        order = { _key(p): i for i, p in enumerate(space) }
+        budget = min(self.budget, len(space))
+
+        # every param as the index of its value among the grid values
+        keys = list(space[0].keys())
+        values = [ list(dict.fromkeys(p[k] for p in space)) for k in keys ]
+        x = np.array([ [ v.index(p[k]) for k, v in zip(keys, values) ]
+                       for p in space ])
+
+        scores = np.full(len(space), -np.inf)
+        evaluated = np.zeros(len(space), dtype=bool)
+        todo = rs.choice(len(space), max(1, budget // 4), replace=False)
+
+        while len(todo) > 0:
+            for params, report in evaluate([ space[i] for i in todo ], data):
+                s = score(report)
+                scores[order[_key(params)]] = -np.inf if s is None or np.isnan(s) else s
+                yield params, report
+            evaluated[todo] = True
+
+            done = np.flatnonzero(evaluated)
+            good = done[np.argsort(-scores[done], kind='stable')
+                        [:int(np.ceil(self.gamma * len(done)))]]
+            
+            ratio = np.zeros(len(space))
+            for j, v in enumerate(values):
+                l = np.bincount(x[good, j], minlength=len(v)) + 1
+                g = np.bincount(x[done, j], minlength=len(v)) + 1
+                ratio += np.log((l / l.sum()) / (g / g.sum()))[x[:, j]]
+            ratio[evaluated] = -np.inf
+
+            n = min(self.batch_size, budget - len(done), len(space) - len(done))
+            todo = np.argsort(-ratio, kind='stable')[:max(n, 0)]
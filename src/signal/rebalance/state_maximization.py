@@ -1,18 +1,25 @@
 from datetime import datetime, timedelta
+import os
 from pydantic import BaseModel, conint, confloat, Field
-from typing import List, Any, Callable
+from typing import List, Any, Callable, Literal
 import pandas as pd
 import numpy as np
-from itertools import product
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product, islice
+from collections import deque
+from contextlib import ExitStack
 
 from .base import RebalanceSignal
+from .search import SearchStrategy, ExhaustiveSearch, \
+    SuccessiveHalvingSearch, ModelBasedSearch
 from src.core.db import State
 from src.strategy.rebalance import RebalanceSingleStrategy
 from src.core.logger import logger
-from src.utils.backtest.runner import weight_trade_with_idx
-from src.utils.backtest.em_weight import maximize_return_points_vt
-from src.utils.backtest.backtest import handle_nan
+from src.utils.backtest.runner import weight_trade, weight_trade_group
+from src.utils.executor import stream_jobs, get_pool, tagged
+from src.utils.shared import SharedFrame, shared_values
+from src.utils.backtest.em_weight import maximize_return_points_vt, \
+    maximize_return_points_batch, maximize_return_points_exact
+from src.utils.backtest.backtest import handle_nan, warmup, report_record, fast_scorable
 from src.core.time import current_datetime
 
 
@@ -25,12 +32,32 @@ from src.core.time import current_datetime
 
 
 
+class KlineStateUpdater:
+    def update(self, row: dict) -> None:
+        # append one closed kline (including 'ret') to the buffer
+        raise NotImplementedError()
+    
+    def drop(self) -> None:
+        # remove the oldest kline from the buffer
+        raise NotImplementedError()
+    
+    def window(self, length: int) -> dict[str, np.ndarray] | None:
+        # state columns of the last length klines as get() would return them
+        # for the current buffer, None if they cannot be derived incrementally
+        raise NotImplementedError()
+
+
+
 class KlineStateTemplate:
     def get(self, data: pd.DataFrame, **config) -> pd.DataFrame:
         raise NotImplementedError()
     
     def get_length(self, config_space: dict[str, List[Any]]) -> int:
         raise NotImplementedError()
+    
+    def get_updater(self, data: pd.DataFrame, **config) -> KlineStateUpdater | None:
+        # data is the output of get(), None means no incremental support
+        return None
 
 
 
@@ -52,22 +79,131 @@ class SmConfig(BaseModel):
     score_metric: Callable = Field(default=lambda x: handle_nan(x['Avg. Annual Return [%]']))
     optimize_ref_date: datetime | None = Field(default=None)
     save_opt_results: bool
+    solver: Literal['grid', 'exact'] = Field(default='grid')
+    opt_cache: bool = Field(default=True)
+    save_opt_cache: bool = Field(default=False)
+    # score the grid with the NumPy simulator, its reports only have the
+    # LazyReport metrics: a score_metric reading other (vectorbt stats)
+    # keys is scored with vectorbt instead
+    fast_scoring: bool = Field(default=True)
+    batch_size: conint(gt=0) = Field(default=64)
+    search: Literal['exhaustive', 'halving', 'model'] = Field(default='exhaustive')
+    search_budget: conint(gt=0) = Field(default=32)
+    halving_rate: conint(gt=1) = Field(default=3)
+    halving_min_length: conint(gt=1) | None = Field(default=None)
+
+
+
+
 
 
 
 
 
+def state_match_windows(state: np.ndarray,
+                        ret: np.ndarray,
+                        lookback: int,
+                        forward_length: int,
+                        offset: int,
+                        start: int):
+    """Padded state-matched return windows for every bar from ``start``.
+
+    Row ``k`` describes bar ``start + k``: its lookback window ends at
+    ``bar - offset`` and a window position is selected when any of the
+    ``forward_length`` positions up to and including it (inside the window)
+    has the same state as the last one.
+    """
+    n = len(state)
+    last = np.arange(start, n) - offset
+    first = last - lookback + 1
+
+    pos = first[:, None] + np.arange(lookback)
+    valid = (pos >= 0) & (pos < n)
+    pos = np.clip(pos, 0, n - 1)
+
+    last_st = state[np.clip(last, 0, n - 1)]
+    matched = (state[pos] == last_st[:, None]) & valid
+
+    # interval coverage: position c is covered by a matched start in
+    # [c - forward_length + 1, c], read off a prefix sum over the window
+    cs = np.zeros((len(last), lookback + 1), dtype=np.int64)
+    np.cumsum(matched, axis=1, out=cs[:, 1:])
+    cols = np.arange(lookback)
+    covered = (cs[:, cols + 1] - cs[:, np.maximum(cols - forward_length + 1, 0)]) > 0
+    covered &= valid
+
+    return ret[pos], covered, last_st, np.clip(first, 0, None), last
+
+
+
+
 
 
 
 
 class GetWeightFn:
     def __init__(self, fee, kline_state: KlineStateTemplate,
-                 rng=np.arange(0, 1.01, 0.1)) -> None:
+                 rng=np.arange(0, 1.01, 0.1),
+                 vectorized=True,
+                 solver: Literal['grid', 'exact'] = 'grid') -> None:
         self.fee = fee
         self.kline_state = kline_state
         self.rng = rng
+        self.vectorized = vectorized
+        self.solver = solver
+    
+    def _fraction_batch(self, ret: np.ndarray, sel: np.ndarray | None,
+                        fee_adj: float, prev: float | np.ndarray):
+        if self.solver == 'exact':
+            return maximize_return_points_exact(ret, sel,
+                                                patial_entry_fee=self.fee*fee_adj,
+                                                patial_exit_fee=self.fee*fee_adj,
+                                                prev=prev)
+        return maximize_return_points_batch(ret, sel,
+                                            patial_entry_fee=self.fee*fee_adj,
+                                            patial_exit_fee=self.fee*fee_adj,
+                                            prev=prev,
+                                            rng=self.rng)
     
+    def _fraction(self, ret: np.ndarray, fee_adj: float, prev: float):
+        return self._fraction_batch(ret[None], None, fee_adj, prev)[0]
+
+    def _fraction_path(self, ret: np.ndarray, sel: np.ndarray,
+                       fee_adj: float, initial_w: float,
+                       known: np.ndarray | None = None,
+                       known_w: np.ndarray | None = None,
+                       known_prev: np.ndarray | None = None):
+        # fractions of consecutive bars, each one using the previous as prev.
+        # Solve every bar in batch with a guessed prev, then re-solve only the
+        # bars whose prev turned out different until nothing changes.
+        # known: bars whose fraction is already known_w given known_prev
+        fraction = lambda idx, prev: self._fraction_batch(ret[idx], sel[idx],
+                                                          fee_adj, prev)
+
+        prev = np.full(len(ret), initial_w, dtype=float)
+        w = np.empty(len(ret))
+        if known is None:
+            known = np.zeros(len(ret), dtype=bool)
+        else:
+            prev[known] = known_prev[known]
+            w[known] = known_w[known]
+        todo = np.flatnonzero(~known)
+        if len(todo) > 0:
+            w[todo] = fraction(todo, prev[todo])
+        while True:
+            _prev = np.concatenate([[initial_w], w[:-1]])
+            changed = np.flatnonzero((_prev != prev) & ~(np.isnan(_prev) & np.isnan(prev)))
+            if len(changed) == 0:
+                return w
+            w[changed] = fraction(changed, _prev[changed])
+            prev = _prev
+
+    def _get_state(self, data: pd.DataFrame, *args, **kwargs):
+        data = data.copy()
+        data['ret'] = data['close'].pct_change().fillna(0)
+
+        return self.kline_state.get(data, *args, **kwargs)
+
     def _get_weight(self,
                     data: pd.DataFrame,
                     lookback: int,
@@ -78,11 +214,155 @@ class GetWeightFn:
                     initial_w: float | None=None,
                     lastest_only=False,
                     **kwargs):
-        
-        data = data.copy()
-        data['ret'] = data['close'].pct_change().fillna(0)
+        data = self._get_state(data, *args, **kwargs)
+
+        return self._get_weight_from_state(data, lookback, forward_length,
+                                           fee_adj, offset,
+                                           initial_w=initial_w,
+                                           lastest_only=lastest_only)
+
+    def _get_weight_from_state(self,
+                               data: pd.DataFrame,
+                               lookback: int,
+                               forward_length: int,
+                               fee_adj: int,
+                               offset: int,
+                               *args,
+                               initial_w: float | None=None,
+                               lastest_only=False,
+                               cache: dict | None=None,
+                               **kwargs):
+        # data is the output of _get_state, kline state params are ignored.
+        # cache: _weight_cache() of an earlier call with the same params,
+        # bars whose inputs did not change reuse its fractions
+        if not self.vectorized:
+            return self._get_weight_loop(data, lookback, forward_length,
+                                         fee_adj, offset,
+                                         initial_w=initial_w,
+                                         lastest_only=lastest_only)
+
+        n = len(data)
+        start = n - 1 if lastest_only else lookback
+
+        weight = np.zeros(n)
+        ret_avg = np.full(n, np.nan)
+        ret_count = np.full(n, np.nan)
+        last_st = np.full(n, np.nan)
+        w_kline_start = np.full(n, np.datetime64('NaT'), dtype=data.index.values.dtype)
+        w_kline_last = w_kline_start.copy()
+        w_kline_count = np.full(n, np.nan)
+
+        if start < n:
+            ret, sel, st, first, last = state_match_windows(
+                data['state'].to_numpy(dtype=float),
+                data['ret'].to_numpy(dtype=float),
+                lookback, forward_length, offset, start)
+
+            count = sel.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ret_avg[start:] = np.where(sel, ret, 0).sum(axis=1) / count
+            ret_count[start:] = count
+            last_st[start:] = st
+            w_kline_start[start:] = data.index.values[first]
+            w_kline_last[start:] = data.index.values[last]
+            w_kline_count[start:] = last - first + 1
+
+            weight[start:] = self._fraction_path(ret, sel, fee_adj, initial_w or 0,
+                                                 *self._reusable(cache, data, start,
+                                                                 first, last))
+
+        weight = pd.DataFrame({
+            'weight': weight,
+            'ret_avg': ret_avg,
+            'ret_count': ret_count,
+            'last_st': last_st,
+            'w_kline_start': w_kline_start,
+            'w_kline_last': w_kline_last,
+            'w_kline_count': w_kline_count,
+        }, index=data.index)
+
+        return data.join(weight)
+
+    def _get_weight_warm(self, data: pd.DataFrame, *args,
+                         cache: tuple | None=None, **kwargs):
+        # _get_weight_from_state warm started from a frame of caches,
+        # cache: (previous, column, out, out_column), previous the frame of
+        # an earlier call (or None) with this params' weights at column (or
+        # None), this call's cache is written into out at out_column.
+        # Both are SharedFrame, so only handles go between processes
+        previous, column, out, out_column = cache
+        initial_w = kwargs.get('initial_w')
+        data = self._get_weight_from_state(data, *args,
+                                           cache=self._frame_cache(previous, column, initial_w),
+                                           **kwargs)
+        new = self._weight_cache(data, initial_w)
+        values = shared_values(out)
+        values[:, 0] = new['state']
+        values[:, 1] = new['ret']
+        values[:, out_column] = new['weight']
+        return data, None
+
+    @staticmethod
+    def _frame_cache(frame: pd.DataFrame | None, column, initial_w: float | None=None):
+        # the _weight_cache() of column of a frame of caches
+        if frame is None or column is None:
+            return None
+        weight = frame[column].to_numpy()
+        prev = np.concatenate([[np.nan], weight[:-1]])
+        return {
+            'time': frame.index.values.astype('datetime64[ns]').astype(np.int64),
+            'state': frame['state'].to_numpy(),
+            'ret': frame['ret'].to_numpy(),
+            'weight': weight,
+            'prev': np.where(np.isnan(prev), initial_w or 0, prev),
+        }
 
-        data = self.kline_state.get(data, *args, **kwargs)
+    @staticmethod
+    def _weight_cache(data: pd.DataFrame, initial_w: float | None=None) -> dict:
+        # per bar inputs and fractions of a _get_weight_from_state result
+        computed = data['ret_count'].notna().to_numpy()
+        weight = np.where(computed, data['weight'].to_numpy(), np.nan)
+        prev = np.concatenate([[np.nan], weight[:-1]])
+        return {
+            'time': data.index.values.astype('datetime64[ns]').astype(np.int64),
+            'state': data['state'].to_numpy(dtype=float),
+            'ret': data['ret'].to_numpy(dtype=float),
+            'weight': weight,
+            'prev': np.where(np.isnan(prev), initial_w or 0, prev),
+        }
+
+    @staticmethod
+    def _reusable(cache: dict | None, data: pd.DataFrame, start: int,
+                  first: np.ndarray, last: np.ndarray):
+        # bars from start whose state-matched window is unchanged since cache
+        if not cache:
+            return None, None, None
+        
+        time = data.index.values.astype('datetime64[ns]').astype(np.int64)
+        pos = np.clip(np.searchsorted(cache['time'], time), 0, len(cache['time']) - 1)
+        found = cache['time'][pos] == time
+
+        same = lambda a, b: (a == b) | (np.isnan(a) & np.isnan(b))
+        same = found & \
+            same(cache['state'][pos], data['state'].to_numpy(dtype=float)) & \
+                same(cache['ret'][pos], data['ret'].to_numpy(dtype=float))
+        
+        changed = np.concatenate([[0], np.cumsum(~same)])
+        pos = pos[start:]
+        known = found[start:] & \
+            (changed[last + 1] == changed[first]) & \
+                ~np.isnan(cache['weight'][pos])
+
+        return known, cache['weight'][pos], cache['prev'][pos]
+
+    def _get_weight_loop(self,
+                         data: pd.DataFrame,
+                         lookback: int,
+                         forward_length: int,
+                         fee_adj: int,
+                         offset: int,
+                         initial_w: float | None=None,
+                         lastest_only=False):
 
         weight = pd.DataFrame(index=data.index)
         weight['weight'] = 0.0
@@ -91,7 +371,7 @@ class GetWeightFn:
 
         for i in range(len(data) - 1 if lastest_only else lookback, len(data)):
             idx = data.index[i]
-            sel = data.index[i + 1 - offset - lookback:
+            sel = data.index[max(i + 1 - offset - lookback, 0):
                              i + 1 - offset]
 
             window = data.loc[sel]
@@ -114,7 +394,7 @@ class GetWeightFn:
                                           patial_entry_fee=self.fee*fee_adj,
                                           patial_exit_fee=self.fee*fee_adj,
                                           prev=prev_w,
-                                          rng=np.arange(0, 1.00001, 0.1))
+                                          rng=self.rng)
 
             weight.loc[idx, 'weight'] = w
             weight.loc[idx, 'ret_avg'] = ret.mean()
@@ -137,6 +417,127 @@ class GetWeightFn:
 
 
 
+class IncrementalWeightFn:
+    """Live counterpart of ``GetWeightFn._get_weight(..., lastest_only=True)``.
+
+    Keeps the kline buffer, its returns and the kline state updater between
+    calls so a new closed kline only costs a kline state update plus one
+    O(lookback) window. Falls back to a full rebuild when the params change,
+    the kline state has no updater or the buffer does not continue the
+    previous one.
+    """
+
+    def __init__(self, get_weight: GetWeightFn) -> None:
+        self.get_weight = get_weight
+        self.reset()
+    
+    def reset(self):
+        self._key = None
+        self._updater: KlineStateUpdater | None = None
+        self._index = deque()
+        self._close = deque()
+        self._ret = deque()
+
+    def _rebuild(self, data: pd.DataFrame, key, args, kwargs):
+        logger.debug(f'signal | rebuild incremental state ({len(data)} klines)')
+        self.reset()
+
+        state = self.get_weight._get_state(data, *args, **kwargs)
+        self._updater = self.get_weight.kline_state.get_updater(state, *args, **kwargs)
+        self._key = key
+        self._index.extend(data.index)
+        self._close.extend(data['close'])
+        self._ret.extend(state['ret'])
+
+        return state.drop(columns=[*data.columns, 'ret'])
+    
+    def _advance(self, data: pd.DataFrame):
+        if len(self._index) == 0 or self._updater is None:
+            return False
+        
+        # number of klines appended since the last call
+        freq = data.index.freq or (data.index[-1] - data.index[-2])
+        new = int((data.index[-1] - self._index[-1]) / freq)
+        if new < 0 or new >= len(data) or \
+            data.index[-1 - new] != self._index[-1] or \
+                data['close'].iloc[-1 - new] != self._close[-1]:
+            return False
+
+        for i in range(len(data) - new, len(data)):
+            row = data.iloc[i].to_dict()
+            row['ret'] = row['close'] / self._close[-1] - 1
+
+            while len(self._index) >= len(data):
+                self._index.popleft()
+                self._close.popleft()
+                self._ret.popleft()
+                self._updater.drop()
+
+            self._updater.update(row)
+            self._index.append(data.index[i])
+            self._close.append(row['close'])
+            self._ret.append(row['ret'])
+
+        # a full get() sees no return for the first kline of the buffer
+        self._ret[0] = 0.0
+
+        return len(self._index) == len(data) and self._index[0] == data.index[0]
+
+    def __call__(self,
+                 data: pd.DataFrame,
+                 lookback: int,
+                 forward_length: int,
+                 fee_adj: int,
+                 offset: int,
+                 *args,
+                 initial_w: float | None=None,
+                 **kwargs) -> pd.Series:
+        key = (self.get_weight.fee, lookback, forward_length, fee_adj, offset,
+               args, tuple(sorted(kwargs.items())))
+
+        n = len(data)
+        m = min(n, lookback + offset)
+
+        columns = None
+        if key == self._key and self._advance(data):
+            columns = self._updater.window(m)
+        if columns is None:
+            state = self._rebuild(data, key, args, kwargs)
+            columns = { c: state[c].to_numpy()[-m:] for c in state.columns }
+
+        ret_tail = np.fromiter(islice(reversed(self._ret), m), dtype=float, count=m)[::-1]
+        ret, sel, st, first, last = state_match_windows(columns['state'].astype(float),
+                                                        ret_tail,
+                                                        lookback,
+                                                        forward_length,
+                                                        offset,
+                                                        m - 1)
+        ret = ret[0][sel[0]]
+        first, last = first[0] + n - m, last[0] + n - m
+
+        w = self.get_weight._fraction(ret, fee_adj, initial_w or 0)
+
+        return pd.Series({
+            **data.iloc[-1].to_dict(),
+            'ret': self._ret[-1],
+            **{ c: v[-1] for c, v in columns.items() },
+            'weight': w,
+            'ret_avg': ret.mean() if len(ret) > 0 else np.nan,
+            'ret_count': float(len(ret)),
+            'last_st': st[0],
+            'w_kline_start': data.index[first],
+            'w_kline_last': data.index[last],
+            'w_kline_count': float(last - first + 1),
+        }, name=data.index[-1])
+
+
+
+
+
+
+
+
+
 class StateMaximization(RebalanceSignal):
     
     # ===== Init part =====
@@ -157,26 +558,61 @@ class StateMaximization(RebalanceSignal):
         config['save_opt_results'] = config.get('save_opt_results') or False
 
         self.config = SmConfig(**config)
+        if self.config.fast_scoring and not fast_scorable(self.config.score_metric):
+            logger.warning('optimize | score_metric reads metrics fast scoring does not '
+                           'report, scoring with vectorbt')
+            self.config.fast_scoring = False
+        self._tick_weight: IncrementalWeightFn | None = None
+        # weight caches of the last optimization per kline state params,
+        # frames of the bars' state and ret then a weight column per params,
+        # see _mp_opt_windows
+        self._opt_cache: dict[tuple, pd.DataFrame] = {}
 
     
     def get_config(self) -> dict:
         return self.config.model_dump()
 
 
+    def state_paths(self) -> list[str]:
+        return ['state', 'params',
+                *(['opt_results'] if self.config.save_opt_results else []),
+                *(['opt_cache'] if self.config.save_opt_cache else [])]
+
+
     def inject_state(self, state: State):
         super().inject_state(state)
-        self.state.load('state')
-        self.state.load('params')
-        if self.config.save_opt_results:
-            self.state.load('opt_results')
+        self.state.load(self.state_paths())
+        if self.config.save_opt_cache:
+            # one document per entry, a single one outgrows the 16MB
+            # document limit of MongoDB on moderate grids
+            entries = self.state.sub_state('opt_cache')
+            names = [ str(i) for i in range(self.state['opt_cache'].get('count', 0)) ]
+            entries.load(names)
+            groups: dict[tuple, list[dict]] = {}
+            for e in map(entries.__getitem__, names):
+                kline_params = { k: e['params'][k] for k in self.kline_state_config }
+                groups.setdefault(self._cache_key(kline_params, e['fee'], e['solver']), []) \
+                    .append(e)
+            self._opt_cache = {
+                key: self._cache_frame(pd.to_datetime(np.asarray(group[0]['time'])),
+                                       group[0]['state'], group[0]['ret'],
+                                       [ self._combo_label(e['params']) for e in group ],
+                                       [ e['weight'] for e in group ])
+                for key, group in groups.items()
+            }
 
 
     def inject_strategy(self, strategy: RebalanceSingleStrategy):
         super().inject_strategy(strategy)
         self.strategy: RebalanceSingleStrategy = strategy
-        
+        self.init_params(current_datetime(),
+                         self.strategy.dt.get_klines,
+                         self.strategy.trading_fee)
+
+
+    def init_params(self, now: datetime, get_klines, fee: float):
+        # params at start up, get_klines(limit, now=) as DataBroker.get_klines
         if not self.config.optimize:
-            now = current_datetime()
             self.state['params'] = {
                 'date': now,
                 '_expected_expire': now + self.config.opt_freq * self.config.trade_freq,
@@ -191,13 +627,12 @@ class StateMaximization(RebalanceSignal):
             }
         else:
             td = (self.config.opt_freq * pd.to_timedelta(f'1day'))
-            now = current_datetime()
             if self.config.optimize_ref_date:
                 now = self.config.optimize_ref_date + \
                     int((now - self.config.optimize_ref_date) / td) * td
             self.optimize(
-                self.strategy.dt.get_klines(self.config.opt_range, now=now),
-                self.strategy.trading_fee,
+                get_klines(self.config.opt_range, now=now),
+                fee,
                 now=now,
                 save=True,
                 idle_verbose=True
@@ -211,50 +646,229 @@ class StateMaximization(RebalanceSignal):
 
     # ===== Hyperparams Optimize part =====
 
-    def _mp_opt(self, data: pd.DataFrame, fee: float):
-        with ProcessPoolExecutor() as executor:
-            futures = []
-            
-            for (
-                lookback,
-                forward_length,
-                fee_adj,
-                offset,
-                *kline_cfg
-            ) in product(
+    def _param_space(self):
+        return [
+            dict(
+                lookback=lookback,
+                forward_length=forward_length,
+                fee_adj=fee_adj,
+                offset=offset,
+                **dict(zip(self.kline_state_config.keys(), kline_cfg))
+            ) for kline_cfg in product(*self.kline_state_config.values())
+            for lookback, forward_length, fee_adj, offset in product(
                 self.config.lookback,
                 self.config.forward_length,
                 self.config.fee_adj,
-                self.config.offset,
-                *[ v for v in self.kline_state_config.values() ]
-            ):
-                params = dict(
-                    lookback=lookback,
-                    forward_length=forward_length,
-                    fee_adj=fee_adj,
-                    offset=offset,
-                    **dict(zip(self.kline_state_config.keys(), kline_cfg))
-                )
-
-                f = executor.submit(weight_trade_with_idx,
-                                    params,
-                                    data=data,
-                                    get_weight=GetWeightFn(fee=fee,
-                                                           kline_state=self.kline_state
-                                                           )._get_weight,
-                                    get_weight_params=params,
-                                    trade_freq=self.config.trade_freq,
-                                    fee=fee,
-                                    start_equity=10000)
-                
-                futures.append(f)
-
-                results = []
-                for f in as_completed(futures):
-                    params, report = f.result()
-                    results.append((params, report))
+                self.config.offset
+            )
+        ]
+
+
+    def _param_groups(self, space: list[dict]):
+        # hyperparams grouped by kline state config, which alone
+        # determines the state series
+        groups: dict[tuple, tuple[dict, list[dict]]] = {}
+        for params in space:
+            kline_params = { k: params[k] for k in self.kline_state_config.keys() }
+            groups.setdefault(tuple(kline_params.items()), (kline_params, []))[1] \
+                .append(params)
+        return list(groups.values())
+
+
+    def _search_strategy(self) -> SearchStrategy:
+        if self.config.search == 'halving':
+            return SuccessiveHalvingSearch(
+                rate=self.config.halving_rate,
+                min_length=self.config.halving_min_length or self.config.opt_freq
+            )
+        if self.config.search == 'model':
+            return ModelBasedSearch(budget=self.config.search_budget,
+                                    batch_size=2 * (os.cpu_count() or 1))
+        return ExhaustiveSearch()
+
+
+    def _cache_key(self, kline_params: dict, fee: float, solver: str | None = None):
+        # weights of another solver differ, so do their caches
+        return solver or self.config.solver, fee, tuple(sorted(kline_params.items()))
+
+
+    @staticmethod
+    def _combo_label(params: dict):
+        return tuple(sorted(params.items()))
+
+
+    @staticmethod
+    def _cache_frame(index: pd.DatetimeIndex, state, ret,
+                     labels: list, weights: list) -> pd.DataFrame:
+        return pd.DataFrame(np.column_stack([state, ret, *weights]).reshape(len(index), -1),
+                            index=index,
+                            columns=pd.Index(['state', 'ret', *labels], tupleize_cols=False))
+
+
+    def _update_opt_cache(self, key: tuple, frame: pd.DataFrame):
+        # the caches of the other params stay if computed on the same bars
+        old = self._opt_cache.get(key)
+        if old is not None and old.index.equals(frame.index) and \
+                old[['state', 'ret']].equals(frame[['state', 'ret']]):
+            frame = pd.concat([old.drop(columns=frame.columns[2:], errors='ignore'),
+                               frame.iloc[:, 2:]], axis=1)
+        self._opt_cache[key] = frame
+
+
+    def _prune_opt_cache(self, space: list[dict], fee: float):
+        # only the caches of the params of space are kept
+        cache = {}
+        for kline_params, params_list in self._param_groups(space):
+            key = self._cache_key(kline_params, fee)
+            if key not in self._opt_cache:
+                continue
+            frame = self._opt_cache[key]
+            labels = [ l for l in map(self._combo_label, params_list) if l in frame.columns ]
+            if labels:
+                cache[key] = frame[pd.Index(['state', 'ret', *labels], tupleize_cols=False)]
+        self._opt_cache = cache
+
+
+    def _mp_opt(self, data: pd.DataFrame, fee: float, space: list[dict],
+                eval_start: datetime | None = None):
+        # yields (params, report) as soon as each job finishes
+        for _, params, report in self._mp_opt_windows([data], fee, space,
+                                                      warm=self.config.opt_cache,
+                                                      eval_start=eval_start):
+            yield params, report
+
+
+    def _mp_opt_windows(self, windows: list[pd.DataFrame], fee: float,
+                        space: list[dict], warm=False,
+                        eval_start: datetime | None = None):
+        # yields (window index, params, report) as soon as each job finishes,
+        # warm: start from the weight caches in self._opt_cache and update them
+        # (a single window), eval_start: score the trades from it only
+        if warm and len(windows) > 1:
+            raise ValueError('warm start needs a single window')
+        get_weight = GetWeightFn(fee=fee,
+                                 kline_state=self.kline_state,
+                                 solver=self.config.solver)
+        groups = self._param_groups(space)
+        workers = os.cpu_count() or 1
+
+        # one state computation per group, split further only to keep
+        # every core busy when there are fewer groups than workers
+        n_split = max(1, workers // (len(groups) * len(windows)))
+
+        def jobs(shared: list[SharedFrame], previous: list[tuple], out: list[SharedFrame]):
+            for w, data in enumerate(shared):
+                for g, (kline_params, params_list) in enumerate(groups):
+                    size = int(np.ceil(len(params_list) / n_split))
+                    for i in range(0, len(params_list), size):
+                        chunk = params_list[i:i + size]
+                        kwargs = dict(
+                            data=data,
+                            get_state=get_weight._get_state,
+                            get_state_params=kline_params,
+                            get_weight=get_weight._get_weight_from_state,
+                            trade_freq=self.config.trade_freq,
+                            fee=fee,
+                            start_equity=10000,
+                            compact=True,
+                            fast=self.config.fast_scoring,
+                            batch_size=self.config.batch_size,
+                            eval_start=eval_start
+                        )
+                        if warm:
+                            # warm start from the previous overlapping window
+                            frame, columns = previous[g]
+                            kwargs['get_weight'] = get_weight._get_weight_warm
+                            kwargs['caches'] = [
+                                (frame, columns.get(self._combo_label(p)), out[g], 2 + i + j)
+                                for j, p in enumerate(chunk)
+                            ]
+                        yield (w, weight_trade_group, chunk), kwargs
+
+        # klines are published once, tasks only carry a shared memory handle
+        executor = get_pool(workers, initializer=warmup,
+                            preload=[__name__, type(self.kline_state).__module__])
+        with ExitStack() as stack:
+            shared = [ stack.enter_context(SharedFrame(data)) for data in windows ]
+            # the weight caches are published the same way, workers read the
+            # previous ones and write the new ones into out
+            previous, out = [], []
+            for kline_params, params_list in groups if warm else []:
+                frame = self._opt_cache.get(self._cache_key(kline_params, fee))
+                columns = {}
+                if frame is not None:
+                    columns = { l: k for k, l in enumerate(frame.columns) }
+                    frame = stack.enter_context(SharedFrame(frame.set_axis(
+                        ['state', 'ret', *range(2, len(frame.columns))], axis=1)))
+                previous.append((frame, columns))
+                out.append(stack.enter_context(SharedFrame(pd.DataFrame(
+                    np.nan, index=windows[0].index,
+                    columns=['state', 'ret', *range(2, 2 + len(params_list))]))))
+
+            for w, results in stream_jobs(executor,
+                                          tagged,
+                                          jobs(shared, previous, out),
+                                          max_in_flight=2 * workers,
+                                          total=len(windows) * len(space),
+                                          size=lambda res: len(res[1]),
+                                          name='combos'):
+                for params, report, *_ in results:
+                    yield w, params, report
+
+            # entries hold only the bars of the window they were computed on
+            for (kline_params, params_list), frame in zip(groups, out):
+                values = frame.data.to_numpy(copy=True)
+                self._update_opt_cache(self._cache_key(kline_params, fee),
+                                       self._cache_frame(windows[0].index,
+                                                         values[:, 0], values[:, 1],
+                                                         list(map(self._combo_label, params_list)),
+                                                         list(values[:, 2:].T)))
+
+
+    def _search(self, data: pd.DataFrame, fee: float):
+        # best params on data with the configured search strategy,
+        # returns (params, evaluated combos, grid size, results)
+        space = self._param_space()
+        evaluated = 0
+        if self.config.opt_cache:
+            self._prune_opt_cache(space, fee)
+
+        def evaluate(space, data, start=None):
+            nonlocal evaluated
+            for res in self._mp_opt(data, fee, space, eval_start=start):
+                evaluated += 1
+                yield res
+
+        results = []
+        best_score, params = None, None
+        for _params, report in self._search_strategy().search(
+            space, data, evaluate, self.config.score_metric
+        ):
+            score = self.config.score_metric(report)
+            if params is None or score > best_score:
+                best_score, params = score, _params
+                logger.debug(f'optimize | best so far {best_score} {params}')
+            if self.config.save_opt_results:
+                results.append((_params, report_record(report)))
+        
+        logger.info(f'optimize | {self.config.search} search evaluated '
+                    f'{evaluated} combos, full grid is {len(space)}')
         
-        return results
+        return params, evaluated, len(space), results
+
+
+    def _params_state(self, now: datetime, data: pd.DataFrame, params: dict,
+                      evaluated: int, grid_size: int) -> dict:
+        return {
+            'date': now,
+            '_expected_expire': now + self.config.opt_freq * self.config.trade_freq,
+            '_kline_start': data.index[0],
+            '_kline_last': data.index[-1],
+            '_kline_count': len(data),
+            '_evaluated': evaluated,
+            '_grid_size': grid_size,
+            **params
+        }
 
 
     def optimize(self, data: pd.DataFrame, fee: float,
@@ -273,21 +887,42 @@ class StateMaximization(RebalanceSignal):
         logger.info(f'Params expired or not exists, starting optimization')
         logger.info(f'Optimize klines from {data.index[0]} to {data.index[-1]}')
 
-        results = self._mp_opt(data, fee)
-        params, _ = max(results, key=lambda x : self.config.score_metric(x[1]))
+        params, evaluated, grid_size, results = self._search(data, fee)
 
-        self.state['params'] = {
-            'date': now,
-            '_expected_expire': now + self.config.opt_freq * self.config.trade_freq,
-            '_kline_start': data.index[0],
-            '_kline_last': data.index[-1],
-            '_kline_count': len(data),
-            **params
-        }
+        self.state['params'] = self._params_state(now, data, params,
+                                                  evaluated, grid_size)
         if self.config.save_opt_results:
+            # full vectorbt report of the winner, the grid may be fast scored
+            _, best_report = weight_trade(
+                data=data,
+                get_weight=GetWeightFn(fee=fee,
+                                       kline_state=self.kline_state,
+                                       solver=self.config.solver)._get_weight,
+                get_weight_params=params,
+                trade_freq=self.config.trade_freq,
+                fee=fee,
+                start_equity=10000
+            )
             self.state['opt_results'] = {
                 'date': now,
-                'results': results
+                'results': results,
+                'best_report': report_record(best_report)
+            }
+        if self.config.save_opt_cache:
+            entries = self.state.sub_state('opt_cache')
+            count = 0
+            for (solver, fee, _), frame in self._opt_cache.items():
+                common = { 'solver': solver, 'fee': fee,
+                           'time': frame.index.values.astype('datetime64[ns]').astype(np.int64).tolist(),
+                           'state': frame['state'].tolist(),
+                           'ret': frame['ret'].tolist() }
+                for label in frame.columns[2:]:
+                    entries[str(count)] = { **common, 'params': dict(label),
+                                            'weight': frame[label].tolist() }
+                    count += 1
+            self.state['opt_cache'] = {
+                'date': now,
+                'count': count
             }
         
         if save:
@@ -296,6 +931,30 @@ class StateMaximization(RebalanceSignal):
         logger.info(f"Optimize done!, best params is {self.state['params']}")
 
 
+    def optimize_windows(self, windows: list[tuple[datetime, pd.DataFrame]],
+                         fee: float) -> list[dict]:
+        # params state optimize(data, fee, now) would set for each of the
+        # independent (now, data) windows. With the exhaustive search the
+        # jobs of every window share the pool at once, other searches adapt
+        # to their own results and go one window after another
+        if self.config.search != 'exhaustive':
+            found = [ self._search(data, fee)[:3] for _, data in windows ]
+        else:
+            space = self._param_space()
+            best = [ (None, None) ] * len(windows)
+            for w, params, report in self._mp_opt_windows(
+                [ data for _, data in windows ], fee, space
+            ):
+                score = self.config.score_metric(report)
+                if best[w][1] is None or score > best[w][0]:
+                    best[w] = (score, params)
+            found = [ (params, len(space), len(space)) for _, params in best ]
+        
+        logger.info(f'optimize | {len(windows)} windows optimized')
+        return [ self._params_state(now, data, *f)
+                 for (now, data), f in zip(windows, found) ]
+
+
 
     # ===== Signal part =====
 
@@ -308,18 +967,19 @@ class StateMaximization(RebalanceSignal):
         
         params = self.state['params']
 
-        data = GetWeightFn(fee=self.strategy.trading_fee,
-                           kline_state=self.kline_state)._get_weight(
+        if self._tick_weight is None or \
+            self._tick_weight.get_weight.fee != self.strategy.trading_fee:
+            self._tick_weight = IncrementalWeightFn(
+                GetWeightFn(fee=self.strategy.trading_fee,
+                            kline_state=self.kline_state,
+                            solver=self.config.solver))
+
+        last = self._tick_weight(
             data=data,
-            **{ k: v for k, v in params.items() if k not in [
-                'date', '_expected_expire', '_kline_start',
-                '_kline_last', '_kline_count'
-            ] },
-            initial_w=initial_frac,
-            lastest_only=True
+            **{ k: v for k, v in params.items()
+                if k != 'date' and not k.startswith('_') },
+            initial_w=initial_frac
         )
-
-        last = data.iloc[-1]
         last_idx = data.index[-1]
         fraction = last['weight']
 
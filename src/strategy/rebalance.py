@@ -2,14 +2,32 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from ccxt import Exchange
+from ccxt.async_support import Exchange as AsyncExchange
 from src.core.db import State
 from src.strategy.base import BaseStrategy
-from src.core.data import DataBroker
+from src.core.data import DataBroker, AsyncDataBroker
+from src.core.store import KlineStore
+from src.core.orders import OrderTracker
 from src.signal.rebalance.base import RebalanceSignal
 from src.core.logger import logger
-from src.utils.calc import calc_precision
+from src.utils.calc import rebalance_diff
 from src.core.time import current_datetime
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+
+
+def data_broker(ex: Exchange, symbol: str, timeframe: str,
+                data_ex: AsyncExchange | None = None,
+                kline_store: str | None = None) -> DataBroker:
+    # the DataBroker of a symbol, async on data_ex if given,
+    # backed by a KlineStore under the kline_store directory if given
+    store = None if kline_store is None else \
+        KlineStore(kline_store, ex.id, symbol, timeframe)
+    if data_ex is None:
+        return DataBroker(ex, symbol, timeframe, store=store)
+    return AsyncDataBroker(data_ex, symbol, timeframe, store=store)
 
 
 
@@ -22,10 +40,17 @@ class RebalanceSingleStrategy(BaseStrategy):
                  fraction: RebalanceSignal | float,
                  name: str = 'rebalance-single',
                  live: bool = False,
-                 pre_fetch=True):
+                 pre_fetch=True,
+                 data_ex: AsyncExchange | None = None,
+                 kline_store: str | None = None,
+                 order_tracker: OrderTracker | None = None):
+        # data_ex: fetch klines through an AsyncDataBroker on this exchange,
+        # kline_store: directory of the KlineStores of the klines,
+        # order_tracker: waits for the rebalance orders to be filled
         super().__init__(ex, name)
         self.live = live
-        self.dt = DataBroker(ex, symbol, timeframe)
+        self.orders = order_tracker or OrderTracker(ex)
+        self.dt = data_broker(ex, symbol, timeframe, data_ex, kline_store)
         self.symbol = symbol
         self.market_info = self.ex.load_markets()[self.symbol]
         self.base = self.market_info['base']
@@ -50,9 +75,13 @@ class RebalanceSingleStrategy(BaseStrategy):
         logger.info(f'initial balance: {self.ex.fetch_balance()["total"]}')
     
 
+    def state_paths(self) -> list[str]:
+        return ['tick', *[ 'signal/' + p for p in self.fraction.state_paths() ]]
+
+
     def inject_state(self, state: State):
         super().inject_state(state)
-        self.state.load('tick')
+        self.state.load(self.state_paths())
         self.fraction.inject_state(state.sub_state('signal'))
         self.fraction.inject_strategy(self)
     
@@ -66,17 +95,11 @@ class RebalanceSingleStrategy(BaseStrategy):
 
 
     def _rebalance(self, now: datetime, frac: float):
-        quote_invest = self.equity * frac
-        base_invest = quote_invest / self.last_price
-
-        diff_base = base_invest - self.base_bal
-        diff_base = calc_precision(diff_base,
-                                   self.base_precision,
-                                   np.floor if diff_base > 0 else np.ceil)
-        
-        if np.abs(diff_base) < self.min_trade_base:
-            diff_base = 0
-        
+        quote_invest, base_invest, diff_base = rebalance_diff(self.equity, frac,
+                                                              self.last_price,
+                                                              self.base_bal,
+                                                              self.base_precision,
+                                                              self.min_trade_base)
         
         response = dict(
             time=now,
@@ -110,13 +133,7 @@ class RebalanceSingleStrategy(BaseStrategy):
 
         if _res is not None:
             logger.info(f'awaiting order...')
-            while True:
-                o = self.ex.fetch_order(_res['id'], self.symbol)
-                if o['status'] != 'closed':
-                    sleep(1)
-                    continue
-                res = o
-                break
+            res = self.orders.wait([ { **_res, 'symbol': self.symbol } ])[0]
             logger.info(f'order filled!')
         else:
             res = None
@@ -183,3 +200,260 @@ class RebalanceSingleStrategy(BaseStrategy):
 
         self.fraction.post_tick(now)
 
+
+
+
+
+
+
+
+class SymbolSleeve:
+    # one symbol of a RebalancePortfolioStrategy, exposes what a
+    # RebalanceSignal reads from its strategy (dt, trading_fee, equity,
+    # base_bal, last_price), equity being the share of the portfolio
+    # equity allocated to the symbol
+    def __init__(self, ex: Exchange,
+                 symbol: str,
+                 timeframe: str,
+                 market_info: dict,
+                 allocation: float,
+                 data_ex: AsyncExchange | None = None,
+                 kline_store: str | None = None):
+        self.symbol = symbol
+        self.dt = data_broker(ex, symbol, timeframe, data_ex, kline_store)
+        self.base = market_info['base']
+        self.quote = market_info['quote']
+        self.trading_fee = market_info['taker']
+        self.base_precision = market_info['precision']['amount']
+        self.min_trade_base = market_info['limits']['amount']['min']
+        self.allocation = allocation
+
+        self.data: pd.DataFrame | None = None
+        self.last_price = np.nan
+        self.base_bal = 0
+        self.equity = 0
+
+
+
+
+
+
+
+class RebalancePortfolioStrategy(BaseStrategy):
+    """Rebalance several symbols quoted in the same currency from one
+    process, every symbol holding its own allocation of the portfolio equity
+    as fraction of it in base currency.
+
+    Klines are fetched and signals ticked concurrently, balances are fetched
+    once per tick and the rebalance orders are sent in batches, sells before
+    buys so they free the quote currency first."""
+
+    def __init__(self, ex: Exchange,
+                 symbols: list[str],
+                 timeframe: str,
+                 fractions: dict[str, RebalanceSignal | float],
+                 allocations: dict[str, float] | None = None,
+                 name: str = 'rebalance-portfolio',
+                 live: bool = False,
+                 pre_fetch=True,
+                 max_workers: int | None = None,
+                 max_batch_orders: int = 20,
+                 data_ex: AsyncExchange | None = None,
+                 kline_store: str | None = None,
+                 order_tracker: OrderTracker | None = None):
+        # data_ex, kline_store, order_tracker: as RebalanceSingleStrategy
+        super().__init__(ex, name)
+        self.live = live
+        self.symbols = symbols
+        self.timeframe = timeframe
+        self.tfdelta = pd.to_timedelta(self.timeframe)
+        self.fractions = fractions
+        self.max_batch_orders = max_batch_orders
+
+        markets = self.ex.load_markets()
+        quotes = { markets[s]['quote'] for s in symbols }
+        if len(quotes) != 1:
+            raise ValueError(f'symbols must share one quote currency ({quotes=})')
+        if len({ markets[s]['base'] for s in symbols }) != len(symbols):
+            raise ValueError('symbols must have distinct base currencies')
+        self.quote = quotes.pop()
+
+        allocations = allocations or { s: 1 / len(symbols) for s in symbols }
+        self.sleeves = {
+            s: SymbolSleeve(ex, s, timeframe, markets[s], allocations[s],
+                            data_ex, kline_store)
+            for s in symbols
+        }
+        # network and signal work of the symbols run side by side
+        self._threads = ThreadPoolExecutor(max_workers or min(32, len(symbols)))
+        self.orders = order_tracker or OrderTracker(ex, executor=self._threads)
+
+        if pre_fetch:
+            self.fetch_klines()
+
+        logger.info(f'live trade: {self.live}')
+        logger.info(f'symbols: {self.symbols}')
+        logger.info(f'quote: {self.quote}')
+        logger.info(f'timeframe: {self.timeframe}')
+        logger.info(f'initial balance: {self.ex.fetch_balance()["total"]}')
+
+
+    def _map(self, fn, symbols=None):
+        symbols = self.symbols if symbols is None else symbols
+        return dict(zip(symbols, self._threads.map(fn, symbols)))
+
+
+    def state_paths(self) -> list[str]:
+        return ['tick', *[ f"{s.replace('/', '-')}/signal/{p}"
+                           for s, f in self.fractions.items()
+                           if isinstance(f, RebalanceSignal)
+                           for p in f.state_paths() ]]
+
+
+    def inject_state(self, state: State):
+        super().inject_state(state)
+        self.state.load(self.state_paths())
+        signals = { s: f for s, f in self.fractions.items()
+                    if isinstance(f, RebalanceSignal) }
+        for s, signal in signals.items():
+            signal.inject_state(
+                state.sub_state(s.replace('/', '-')).sub_state('signal'))
+        # may optimize every signal
+        self._map(lambda s: signals[s].inject_strategy(self.sleeves[s]),
+                  list(signals))
+
+
+    def fetch_klines(self):
+        def fetch(symbol):
+            fraction = self.fractions[symbol]
+            limit = fraction.get_length() \
+                if isinstance(fraction, RebalanceSignal) else 1
+            if type(limit) != int:
+                limit = int(limit / self.tfdelta)
+            self.sleeves[symbol].data = \
+                self.sleeves[symbol].dt.get_klines(limit=limit)
+        self._map(fetch)
+
+
+    def _fetch_account_balance(self):
+        self.balance = self.ex.fetch_balance()['total']
+        self.quote_bal = self.balance.get(self.quote) or 0
+        self.equity = self.quote_bal
+        for sleeve in self.sleeves.values():
+            sleeve.last_price = sleeve.data.iloc[-1]['close']
+            sleeve.base_bal = self.balance.get(sleeve.base) or 0
+            self.equity += sleeve.base_bal * sleeve.last_price
+        for sleeve in self.sleeves.values():
+            sleeve.equity = self.equity * sleeve.allocation
+
+
+    def _plan(self, now: datetime, symbol: str, frac: float):
+        sleeve = self.sleeves[symbol]
+        quote_invest, base_invest, diff_base = rebalance_diff(sleeve.equity, frac,
+                                                              sleeve.last_price,
+                                                              sleeve.base_bal,
+                                                              sleeve.base_precision,
+                                                              sleeve.min_trade_base)
+
+        return dict(
+            time=now,
+            fraction=frac,
+            quote_bal=self.quote_bal,
+            base_bal=sleeve.base_bal,
+            equity=sleeve.equity,
+            quote_invest=quote_invest,
+            base_invest=base_invest,
+            diff_base=diff_base,
+            side=None if diff_base == 0 else 'buy' if diff_base > 0 else 'sell',
+            final_quote_bal=self.quote_bal,
+            final_base_bal=sleeve.base_bal,
+            final_equity=sleeve.equity,
+            traded=False,
+            order=None
+        )
+
+
+    def _create_orders(self, requests: list[dict]) -> list[dict]:
+        if self.ex.has.get('createOrders'):
+            orders = []
+            for i in range(0, len(requests), self.max_batch_orders):
+                orders += self.ex.create_orders(requests[i:i + self.max_batch_orders])
+            return orders
+        return list(self._threads.map(
+            lambda r: self.ex.create_order(r['symbol'], r['type'],
+                                           r['side'], r['amount']),
+            requests
+        ))
+
+
+    def _await_orders(self, orders: list[dict]) -> list[dict]:
+        logger.info(f'awaiting {len(orders)} orders...')
+        filled = self.orders.wait(orders)
+        logger.info(f'orders filled!')
+        return filled
+
+
+    def _rebalance(self, responses: dict[str, dict]):
+        for side in ['sell', 'buy']:
+            symbols = [ s for s, r in responses.items() if r['side'] == side ]
+            if not symbols:
+                continue
+
+            for s in symbols:
+                logger.info(f"rebalancing: {responses[s]['diff_base']} {self.sleeves[s].base}")
+            if not self.live:
+                logger.info(f'rebalancing rejected: not in live mode')
+                continue
+
+            orders = self._create_orders([
+                dict(symbol=s, type='market', side=side,
+                     amount=np.abs(responses[s]['diff_base']))
+                for s in symbols
+            ])
+            orders = [ { **o, 'symbol': s } for s, o in zip(symbols, orders) ]
+            for s, o in zip(symbols, self._await_orders(orders)):
+                responses[s]['traded'] = True
+                responses[s]['order'] = o
+
+        if not any(r['traded'] for r in responses.values()):
+            return responses
+
+        self._fetch_account_balance()
+        for s, r in responses.items():
+            r['final_quote_bal'] = self.quote_bal
+            r['final_base_bal'] = self.sleeves[s].base_bal
+            r['final_equity'] = self.sleeves[s].equity
+        return responses
+
+
+    def tick(self, now: datetime):
+        self.fetch_klines()
+        self._fetch_account_balance()
+
+        def signal_tick(symbol):
+            fraction = self.fractions[symbol]
+            if isinstance(fraction, RebalanceSignal):
+                return fraction.tick(now, self.sleeves[symbol].data)
+            return fraction
+
+        fracs = self._map(signal_tick)
+        res = self._rebalance({ s: self._plan(now, s, f) for s, f in fracs.items() })
+
+        return fracs, res
+
+
+    def post_tick(self, now: datetime, payload):
+        fracs, res = payload
+
+        if self.state:
+            self.state['tick'] = { s.replace('/', '-'): r for s, r in res.items() }
+        
+        logger.info('rebalance done')
+        logger.info(f'equity: {self.equity}')
+        for s, r in res.items():
+            logger.info(f"{s} | fraction: {fracs[s]} diff_base: {r['diff_base']} "
+                        f"final_base_bal: {r['final_base_bal']} traded: {r['traded']}")
+
+        signals = [ s for s, f in self.fractions.items()
+                    if isinstance(f, RebalanceSignal) ]
+        self._map(lambda s: self.fractions[s].post_tick(now), signals)
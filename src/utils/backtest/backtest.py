@@ -1,7 +1,10 @@
 #Usual Suspects
+from collections.abc import Mapping
+from functools import cached_property
 import pandas as pd
 import numpy as np
 import vectorbt as vbt
+from numba import njit
 
 
 
@@ -22,14 +25,16 @@ def annual_return(eq, annual_ratio=None):
     ret = np.log(eq.pct_change().fillna(0) + 1) * annual_ratio
     return ret
 
-def avg_annual_return_percent(eq, annual_ratio=None):
-    return 100 * (np.exp(np.mean(annual_return(eq, annual_ratio))) - 1)
+def avg_annual_return_percent(eq, annual_ratio=None, ret=None):
+    ret = annual_return(eq, annual_ratio) if ret is None else ret
+    return 100 * (np.exp(np.mean(ret)) - 1)
 
-def std_annual_return_percent(eq, annual_ratio=None):
-    return 100 * (np.exp(np.std(annual_return(eq, annual_ratio))) - 1)
+def std_annual_return_percent(eq, annual_ratio=None, ret=None):
+    ret = annual_return(eq, annual_ratio) if ret is None else ret
+    return 100 * (np.exp(np.std(ret)) - 1)
 
-def log_shape_ratio(eq, annual_ratio=None):
-    ret = annual_return(eq, annual_ratio)
+def log_shape_ratio(eq, annual_ratio=None, ret=None):
+    ret = annual_return(eq, annual_ratio) if ret is None else ret
     std = ret.std()
     if std == 0:
         return np.nan
@@ -37,12 +42,237 @@ def log_shape_ratio(eq, annual_ratio=None):
 
 
 
+class LazyReport(Mapping):
+    """Backtest report whose metrics are computed on first access, so
+    scoring by one metric does not pay for the others. Intermediates shared
+    by several metrics are cached properties."""
+
+    # metric name -> method computing it, in report order
+    metrics: dict[str, str] = {
+        'Start Value': '_start_value',
+        'End Value': '_end_value',
+        'Total Return [%]': '_total_return',
+        'Max Drawdown [%]': '_max_drawdown',
+        'Total Fees Paid': '_total_fees',
+        'Avg. Annual Return [%]': '_avg_annual_return',
+        'Std. Annual Return [%]': '_std_annual_return',
+        'Log Sharpe Ratio': '_log_sharpe_ratio',
+    }
+
+    def __init__(self, equity: pd.Series, initial_cash: float | None=None,
+                 fees_paid: float | None=None, annual_ratio=None) -> None:
+        self.equity = equity
+        self.initial_cash = initial_cash
+        self.fees_paid = fees_paid
+        self.annual_ratio = annual_ratio
+        self._values = {}
+    
+    @cached_property
+    def log_returns(self) -> pd.Series:
+        return annual_return(self.equity, self.annual_ratio)
+
+    def _start_value(self):
+        return float(self.initial_cash)
+
+    def _end_value(self):
+        return self.equity.iloc[-1]
+
+    def _total_return(self):
+        return 100 * (self['End Value'] / self['Start Value'] - 1)
+
+    def _max_drawdown(self):
+        return 100 * (1 - self.equity / self.equity.cummax()).max()
+
+    def _total_fees(self):
+        return self.fees_paid
+
+    def _avg_annual_return(self):
+        return avg_annual_return_percent(self.equity, ret=self.log_returns)
+
+    def _std_annual_return(self):
+        return std_annual_return_percent(self.equity, ret=self.log_returns)
+
+    def _log_sharpe_ratio(self):
+        return log_shape_ratio(self.equity, ret=self.log_returns)
+    
+    def _compute(self, key):
+        return getattr(self, self.metrics[key])()
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._compute(key)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self.metrics)
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def compact(self) -> dict[str, float]:
+        # every metric as plain floats, computed here instead of shipping
+        # the equity curve to the process scoring it
+        return report_record(self)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series({ k: self[k] for k in self })
+
+    def __repr__(self) -> str:
+        return repr(self.to_series())
+
+
+
+class PortfolioReport(LazyReport):
+    # vbt Portfolio.stats() followed by the log return metrics,
+    # stats() runs only when one of its metrics is accessed
+
+    metrics = {
+        'Avg. Annual Return [%]': '_avg_annual_return',
+        'Std. Annual Return [%]': '_std_annual_return',
+        'Log Sharpe Ratio': '_log_sharpe_ratio',
+    }
+
+    def __init__(self, portfolio: vbt.Portfolio, equity: pd.Series,
+                 annual_ratio=None) -> None:
+        super().__init__(equity, annual_ratio=annual_ratio)
+        self.portfolio = portfolio
+    
+    @cached_property
+    def stats(self) -> pd.Series:
+        return self.portfolio.stats()
+
+    def _compute(self, key):
+        if key in self.metrics:
+            return super()._compute(key)
+        return self.stats[key]
+
+    def __iter__(self):
+        yield from (k for k in self.stats.index if k not in self.metrics)
+        yield from self.metrics
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+
+def fast_scorable(score_metric) -> bool:
+    # whether score_metric only reads metrics a LazyReport has, probed on
+    # dummy values since it can be any callable over the report
+    try:
+        score_metric({ k: 1.0 for k in LazyReport.metrics })
+    except KeyError:
+        return False
+    return True
+
+
+
+def report_record(report: Mapping) -> dict[str, float]:
+    # numeric metrics of a stats report as plain floats
+    return { k: float(v) for k, v in report.items()
+             if isinstance(v, (int, float, np.number)) }
+
+
+
+@njit(cache=True)
+def _is_close(a, b):
+    # vectorbt's tolerance for float comparisons
+    if a == b:
+        return True
+    return abs(a - b) <= max(1e-9 * max(abs(a), abs(b)), 1e-12)
+
+
+@njit(cache=True)
+def _add(a, b):
+    if np.sign(a) != np.sign(b):
+        zero = _is_close(abs(a), abs(b))
+    else:
+        zero = _is_close(a + b, 0.)
+    return 0. if zero else a + b
+
+
+@njit(cache=True)
+def simulate_target_percent(close: np.ndarray, weights: np.ndarray,
+                            init_cash: float, fees: float,
+                            size_granularity: float = np.nan):
+    # the equity curve and fees paid per bar of a target percent rebalance
+    # at close, the same fills as vbt.Portfolio.from_orders with
+    # size_type='targetpercent' and its default (both directions, partial
+    # buys when short of cash) settings, sizes rounded down to
+    # size_granularity unless it is NaN
+    equity = np.empty(len(close))
+    fees_paid = np.zeros(len(close))
+    cash, position = init_cash, 0.
+
+    for i in range(len(close)):
+        price = close[i]
+        value = cash + position * price if position != 0 else cash
+        cash = 0. if _is_close(cash, 0.) else cash
+        position = 0. if _is_close(position, 0.) else position
+
+        if not np.isnan(weights[i]) and not _is_close(value, 0.) and value > 0:
+            size = weights[i] * value / price - position
+            if size > 0 and not np.isnan(size_granularity):
+                size = size // size_granularity * size_granularity
+            elif size < 0 and not np.isnan(size_granularity):
+                size = -(-size // size_granularity * size_granularity)
+
+            if size > 0 and cash != 0 and not _is_close(size, 0.):
+                req_cash = size * price
+                if req_cash + req_cash * fees <= cash or \
+                        _is_close(req_cash + req_cash * fees, cash):
+                    fees_paid[i] = req_cash * fees
+                    cash = _add(cash, -(req_cash + req_cash * fees))
+                    position = _add(position, size)
+                elif not np.isnan(size_granularity):
+                    max_size = cash / (1 + fees) / price
+                    if max_size > 0:
+                        size = max_size // size_granularity * size_granularity
+                        fees_paid[i] = size * price * fees
+                        cash = _add(cash, -(size * price + fees_paid[i]))
+                        position = _add(position, size)
+                else:
+                    max_req_cash = cash / (1 + fees)
+                    if max_req_cash > 0:
+                        fees_paid[i] = cash - max_req_cash
+                        position = _add(position, max_req_cash / price)
+                        cash = 0.
+            elif size < 0 and not _is_close(-size, 0.):
+                acq_cash = -size * price
+                fees_paid[i] = acq_cash * fees
+                cash = cash + _add(acq_cash, -fees_paid[i])
+                position = _add(position, size)
+
+        equity[i] = cash + position * price
+    return equity, fees_paid
+
+
+
+def fast_backtest_by_weight(data: pd.Series,
+                            weights: pd.Series,
+                            initial_cash=1_000, fees=0.001,
+                            annual_ratio=None,
+                            size_granularity=None):
+    # backtest_by_weight without vectorbt, for scoring many weight series,
+    # the report only has metrics derived from the equity curve and fees
+    equity, fees_paid = simulate_target_percent(
+        data.to_numpy(dtype=float),
+        weights.to_numpy(dtype=float),
+        float(initial_cash), float(fees),
+        np.nan if size_granularity is None else float(size_granularity)
+    )
+    equity = pd.Series(equity, index=data.index)
+    return pd.DataFrame({ 'strategy_equity': equity }), \
+        LazyReport(equity, initial_cash, fees_paid.sum(), annual_ratio)
+
+
+
 def backtest_by_weight(data: pd.DataFrame | pd.Series,
                        weights: pd.DataFrame | pd.Series,
                        initial_cash=1_000, fees=0.001,
                        freq=None, include_baseline=True,
                        return_baseline_report=False,
-                       annual_ratio=None):
+                       annual_ratio=None,
+                       size_granularity=None):
     res = {}
 
     # Create a Portfolio object
@@ -52,13 +282,11 @@ def backtest_by_weight(data: pd.DataFrame | pd.Series,
         size_type='targetpercent',
         freq=freq or data.index.freq,  # Daily rebalancing
         init_cash=initial_cash,
-        fees=fees  # Set transaction fees (optional)
+        fees=fees,  # Set transaction fees (optional)
+        size_granularity=np.nan if size_granularity is None else size_granularity
     )
     res['strategy_equity'] = strategy_port.value()
-    strategy_report = strategy_port.stats()
-    strategy_report['Avg. Annual Return [%]'] = avg_annual_return_percent(res['strategy_equity'], annual_ratio)
-    strategy_report['Std. Annual Return [%]'] = std_annual_return_percent(res['strategy_equity'], annual_ratio)
-    strategy_report['Log Sharpe Ratio'] = log_shape_ratio(res['strategy_equity'], annual_ratio)
+    strategy_report = PortfolioReport(strategy_port, res['strategy_equity'], annual_ratio)
 
     if include_baseline:
         sz = np.full(len(data), 1)
@@ -71,10 +299,7 @@ def backtest_by_weight(data: pd.DataFrame | pd.Series,
             fees=fees  # Set transaction fees (optional)
         )
         res['baseline_equity'] = baseline_port.value()
-        baseline_report = baseline_port.stats()
-        baseline_report['Avg. Annual Return [%]'] = avg_annual_return_percent(res['baseline_equity'], annual_ratio)
-        strategy_report['Std. Annual Return [%]'] = std_annual_return_percent(res['strategy_equity'], annual_ratio)
-        strategy_report['Log Sharpe Ratio'] = log_shape_ratio(res['strategy_equity'], annual_ratio)
+        baseline_report = PortfolioReport(baseline_port, res['baseline_equity'], annual_ratio)
 
 
     if return_baseline_report:
@@ -82,3 +307,44 @@ def backtest_by_weight(data: pd.DataFrame | pd.Series,
     
     return pd.DataFrame(res), strategy_report
 
+
+
+def backtest_by_weights(data: pd.Series,
+                        weights: pd.DataFrame,
+                        initial_cash=1_000, fees=0.001,
+                        freq=None, annual_ratio=None,
+                        chunk_size=64) -> pd.DataFrame:
+    # backtest_by_weight of every weights column against the same close
+    # in one vectorbt simulation per chunk_size columns, which bounds the
+    # memory, returns the metrics table with a row per weights column
+    reports = []
+    for i in range(0, weights.shape[1], chunk_size):
+        port = vbt.Portfolio.from_orders(
+            close=data,
+            size=weights.iloc[:, i:i + chunk_size],
+            size_type='targetpercent',
+            freq=freq or data.index.freq,
+            init_cash=initial_cash,
+            fees=fees
+        )
+        report = port.stats(agg_func=None)
+        # per column with the single weights functions, so a batched
+        # score is exactly the one of backtest_by_weight
+        ret = annual_return(port.value(), annual_ratio)
+        for key, fn in [ ('Avg. Annual Return [%]', avg_annual_return_percent),
+                         ('Std. Annual Return [%]', std_annual_return_percent),
+                         ('Log Sharpe Ratio', log_shape_ratio) ]:
+            report[key] = ret.apply(lambda r: fn(r, ret=r))
+        reports.append(report)
+    return pd.concat(reports)
+
+
+
+def warmup():
+    # compile the vectorbt kernels used by backtest_by_weight, e.g. as a
+    # worker pool initializer so the first real job does not pay for it
+    close = pd.Series([1.0, 1.1, 1.0, 1.2],
+                      index=pd.date_range('2000-01-01', periods=4, freq='D'))
+    backtest_by_weight(close, pd.Series(0.5, index=close.index))[1].compact()
+    fast_backtest_by_weight(close, pd.Series(0.5, index=close.index))[1].compact()
+    backtest_by_weights(close, pd.DataFrame({ 0: 0.5, 1: 1.0 }, index=close.index))
@@ -49,6 +49,95 @@ def maximize_return_points_vt(ret, rng=np.arange(0, 1.01, 0.01),
 
 
 
+def maximize_return_points_batch(ret, mask=None, rng=np.arange(0, 1.01, 0.01),
+                                 patial_entry_fee=0, patial_exit_fee=0,
+                                 exit_fee=0, default=0.5, prev=None):
+    # maximize_return_points_vt for many return sets at once
+    # ret, mask: (n, length) padded returns and their valid entries
+    # prev: None, scalar or (n,) previous fractions
+    ret = np.asarray(ret, dtype=float)
+    if mask is None:
+        mask = np.ones(ret.shape, dtype=bool)
+    
+    prev = np.broadcast_to(np.asarray(prev if prev is not None else 0,
+                                      dtype=float), ret.shape[:1])
+    
+    frac = np.asarray(rng, dtype=float)[None, :, None]
+    r = ret[:, None, :]
+    diff = np.abs(frac - prev[:, None, None])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = np.log((r * frac + 1) - \
+                       (diff * patial_entry_fee) - \
+                       ((1 + r) * diff * patial_exit_fee) - \
+                       (np.abs(frac) * exit_fee))
+    score = np.where(mask[:, None, :], score, 0).sum(axis=-1)
+    
+    count = mask.sum(axis=-1)
+    res = np.asarray(rng)[score.argmax(axis=-1)]
+    return np.where(count > 0, res, prev if default is None else default)
+
+
+
+def maximize_return_points_exact(ret, mask=None,
+                                 patial_entry_fee=0, patial_exit_fee=0,
+                                 exit_fee=0, default=0.5, prev=None, tol=1e-3):
+    # continuous maximize_return_points_batch on [0, 1]
+    # The objective is concave in frac with a kink at prev, so check the
+    # kink and the bounds first, then bisect the derivative on one side.
+    ret = np.asarray(ret, dtype=float)
+    if mask is None:
+        mask = np.ones(ret.shape, dtype=bool)
+    
+    prev = np.broadcast_to(np.asarray(prev if prev is not None else 0,
+                                      dtype=float), ret.shape[:1])
+    q = np.clip(prev, 0, 1)
+    fee = patial_entry_fee + (1 + ret) * patial_exit_fee
+
+    def coef(up):
+        # objective terms are log(a + b * frac) on one side of prev,
+        # neutral where masked
+        side = np.where(up, 1.0, -1.0)[:, None]
+        a = np.where(mask, 1 + side * prev[:, None] * fee, 1)
+        b = np.where(mask, ret - side * fee - exit_fee, 0)
+        return a, b
+
+    def slope(frac, up):
+        a, b = coef(up)
+        g = a + b * frac[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # +-inf where frac is already out of the log domain
+            d = np.where(g > 0, b / g, np.sign(b) * np.inf)
+        return np.nan_to_num(d, nan=0, posinf=np.inf, neginf=-np.inf).sum(axis=-1)
+    
+    up = (q < 1) & (slope(q, np.full(q.shape, True)) > 0)
+    down = ~up & (q > 0) & (slope(q, np.full(q.shape, False)) < 0)
+
+    # bisect inside the log domain of the chosen side
+    a, b = coef(up)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        root = -a / b
+    lo = np.maximum(np.where(up, q, 0.0),
+                    np.where(b > 0, root, -np.inf).max(axis=-1))
+    hi = np.minimum(np.where(up, 1.0, q),
+                    np.where(b < 0, root, np.inf).min(axis=-1))
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(int(np.ceil(np.log2(1 / tol)))):
+            mid = (lo + hi) / 2
+            d = (b / (a + b * mid[:, None])).sum(axis=-1)
+            lo = np.where(d > 0, mid, lo)
+            hi = np.where(d > 0, hi, mid)
+
+    res = np.where(up | down, (lo + hi) / 2, q)
+    res = np.where(up & (slope(np.ones(q.shape), up) >= 0), 1.0, res)
+    res = np.where(down & (slope(np.zeros(q.shape), up) <= 0), 0.0, res)
+
+    count = mask.sum(axis=-1)
+    return np.where(count > 0, res, prev if default is None else default)
+
+
+
 def maximize_return_points(ret, bound=(0.0, 1.0),
                            patial_entry_fee=0, patial_exit_fee=0,
                            exit_fee=0, default=0.5, prev=None):
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from .backtest import backtest_by_weight
+from .backtest import backtest_by_weight, fast_backtest_by_weight, \
+    backtest_by_weights, report_record
 
 
 def weight_trade(data: pd.DataFrame,
@@ -9,17 +10,49 @@ def weight_trade(data: pd.DataFrame,
                  trade_freq: pd.Timedelta,
                  fee: float,
                  start_equity: float,
-                 return_baseline_report=False):
+                 return_baseline_report=False,
+                 fast=False):
     
     weight = get_weight(data.copy(), **get_weight_params)
+
+    return trade_weight(data, weight,
+                        trade_freq=trade_freq,
+                        fee=fee,
+                        start_equity=start_equity,
+                        return_baseline_report=return_baseline_report,
+                        fast=fast)
+
+
+
+def trade_weight(data: pd.DataFrame,
+                 weight: pd.DataFrame,
+                 trade_freq: pd.Timedelta,
+                 fee: float,
+                 start_equity: float,
+                 return_baseline_report=False,
+                 fast=False,
+                 eval_start: pd.Timestamp | None=None):
+    # fast: score with the NumPy simulator instead of vectorbt,
+    # the report then only has the equity curve based metrics,
+    # eval_start: trade from it only, the weights may come from before
     
     data = data[['close']].resample(trade_freq).last()
     
     data = data.join(weight[['weight']]).ffill().fillna(0)
+    if eval_start is not None:
+        data = data.loc[eval_start:]
+
+    if fast:
+        if return_baseline_report:
+            raise ValueError('fast trade_weight has no baseline report')
+        return fast_backtest_by_weight(data['close'], data['weight'],
+                                       initial_cash=start_equity,
+                                       fees=fee)
 
     return backtest_by_weight(data['close'], data['weight'],
                               initial_cash=start_equity,
                               fees=fee,
+                              include_baseline=return_baseline_report,
                               return_baseline_report=return_baseline_report)
 
 
@@ -56,8 +89,8 @@ def robust_weight_trade(rand_sequence,
         )
 
         run_results.append(results)
-        run_report.append(report)
-        run_baseline_report.append(baseline_report)
+        run_report.append(report.to_series())
+        run_baseline_report.append(baseline_report.to_series())
     
     run_report = pd.DataFrame(run_report, index=range(len(run_report)))
     run_baseline_report = pd.DataFrame(run_baseline_report, index=range(len(run_baseline_report)))
@@ -73,3 +106,68 @@ def robust_weight_trade(rand_sequence,
 def weight_trade_with_idx(idx, *args, **kwargs):
     _, report = weight_trade(*args, **kwargs)
     return idx, report
+
+
+
+
+def trade_weights(data: pd.DataFrame,
+                  weights: list[pd.DataFrame],
+                  trade_freq: pd.Timedelta,
+                  fee: float,
+                  start_equity: float,
+                  chunk_size=64,
+                  eval_start: pd.Timestamp | None=None) -> pd.DataFrame:
+    # trade_weight of many weights over the same data as one
+    # multi-column backtest, returns a metrics row per weights
+    data = data[['close']].resample(trade_freq).last()
+
+    data = data.join(pd.concat([ w['weight'] for w in weights ], axis=1,
+                               keys=range(len(weights)))).ffill().fillna(0)
+    if eval_start is not None:
+        data = data.loc[eval_start:]
+
+    return backtest_by_weights(data['close'], data.drop(columns='close'),
+                               initial_cash=start_equity,
+                               fees=fee,
+                               chunk_size=chunk_size)
+
+
+
+def weight_trade_group(params_list: list[dict],
+                       data: pd.DataFrame,
+                       get_state,
+                       get_state_params: dict,
+                       get_weight,
+                       compact=False,
+                       caches: list[dict | None] | None=None,
+                       batch_size: int | None=None,
+                       **kwargs):
+    # weight_trade for params sharing the same get_state output,
+    # compact: return report.compact() instead of the full report,
+    # caches: per params warm start, get_weight is then called with cache=
+    # and returns (weight, cache), results become (params, report, cache),
+    # batch_size: backtest the weights together with trade_weights, at
+    # most batch_size per vectorbt call (ignored for fast=True)
+    state = get_state(data.copy(), **get_state_params)
+    weights, new_caches = [], []
+    for i, params in enumerate(params_list):
+        if caches is None:
+            weight = get_weight(state.copy(), **params)
+        else:
+            weight, cache = get_weight(state.copy(), **params, cache=caches[i])
+            new_caches.append(cache)
+        weights.append(weight[['weight']])
+    
+    if batch_size and not kwargs.get('fast'):
+        table = trade_weights(state, weights, chunk_size=batch_size,
+                              **{ k: v for k, v in kwargs.items() if k != 'fast' })
+        reports = [ report_record(r) if compact else r for _, r in table.iterrows() ]
+    else:
+        reports = []
+        for weight in weights:
+            _, report = trade_weight(state, weight, **kwargs)
+            reports.append(report.compact() if compact else report)
+    
+    if caches is None:
+        return list(zip(params_list, reports))
+    return list(zip(params_list, reports, new_caches))
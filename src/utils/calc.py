@@ -7,6 +7,25 @@ def calc_precision(value, precision, roundfn=np.round):
 
 
 
+def rebalance_diff(equity, frac, price, base_bal, base_precision, min_trade_base):
+    # quote and base to invest to hold frac of equity in base and the base
+    # to trade for it, rounded towards zero to base_precision, 0 below
+    # min_trade_base. Returns (quote_invest, base_invest, diff_base)
+    quote_invest = equity * frac
+    base_invest = quote_invest / price
+
+    diff_base = base_invest - base_bal
+    diff_base = calc_precision(diff_base,
+                               base_precision,
+                               np.floor if diff_base > 0 else np.ceil)
+
+    if np.abs(diff_base) < min_trade_base:
+        diff_base = 0
+
+    return quote_invest, base_invest, diff_base
+
+
+
 def validate_precision(value, precision):
     mul = int(value / precision)
 
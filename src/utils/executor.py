@@ -0,0 +1,142 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, \
+    FIRST_COMPLETED, wait
+from typing import Any, Callable, Coroutine, Iterable, Iterator
+from threading import Lock, Thread
+import asyncio
+from time import perf_counter
+import multiprocessing
+import atexit
+import os
+from src.core.logger import logger
+
+
+
+# process wide worker pool, see get_pool()
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = Lock()
+
+# process wide thread pool for blocking I/O, see get_threads()
+_threads: ThreadPoolExecutor | None = None
+_threads_lock = Lock()
+
+# process wide event loop running in a daemon thread, see get_loop()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = Lock()
+
+
+
+def get_pool(max_workers: int | None = None,
+             initializer: Callable | None = None,
+             preload: list[str] | None = None) -> ProcessPoolExecutor:
+    # lazily create the shared worker pool, or recreate it if broken.
+    # Arguments only apply when the pool is created. Workers are forked
+    # from a single threaded fork server rather than from this process,
+    # whose other threads may hold locks at fork time. preload: modules
+    # the fork server imports once for every worker, only applies when
+    # the fork server is started.
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._broken:
+            max_workers = max_workers or os.cpu_count() or 1
+            logger.info(f'executor | starting worker pool ({max_workers} workers)')
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(preload or [])
+            _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=context,
+                                        initializer=initializer)
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+
+def get_threads(max_workers: int = 16) -> ThreadPoolExecutor:
+    # lazily create the shared I/O thread pool, for blocking clients (e.g.
+    # pymongo) to wait on many requests at once. max_workers only applies
+    # when the pool is created.
+    global _threads
+    with _threads_lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers, thread_name_prefix='io')
+        return _threads
+
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    # lazily start the shared event loop, async clients (e.g. ccxt.async_support
+    # exchanges) are bound to the loop they are first used on, so they should
+    # only ever run on this one
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name='event-loop', daemon=True).start()
+        return _loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    # run coro on the shared event loop and block until its result,
+    # must not be called from a coroutine running on that loop
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+
+def tagged(tag: Any, fn: Callable, *args, **kwargs) -> tuple[Any, Any]:
+    # (tag, fn(*args, **kwargs)), to tell which job a streamed result is from
+    return tag, fn(*args, **kwargs)
+
+
+
+def stream_jobs(executor: Executor,
+                fn: Callable,
+                jobs: Iterable[tuple[tuple, dict]],
+                max_in_flight: int,
+                total: int | None = None,
+                size: Callable[[Any], int] = lambda res: 1,
+                name: str = 'jobs',
+                log_interval: float = 5.0) -> Iterator[Any]:
+    # submit fn(*args, **kwargs) for every (args, kwargs) in jobs, keeping at
+    # most max_in_flight pending, and yield results as soon as they finish.
+    # size(result) tells how many units a result counts for in the progress.
+    jobs = iter(jobs)
+    pending = set()
+    done = 0
+    start = last_log = perf_counter()
+
+    def progress():
+        elapsed = perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0
+        return f'{name} | {done}/{total or "?"} done ' \
+            f'in {elapsed:.1f}s ({rate:.2f} {name}/sec)'
+
+    try:
+        while True:
+            for args, kwargs in jobs:
+                pending.add(executor.submit(fn, *args, **kwargs))
+                if len(pending) >= max_in_flight:
+                    break
+            
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in finished:
+                res = f.result()
+                done += size(res)
+                yield res
+            
+            if perf_counter() - last_log >= log_interval:
+                last_log = perf_counter()
+                logger.info(progress())
+    finally:
+        for f in pending:
+            f.cancel()
+
+    logger.info(progress())
@@ -0,0 +1,84 @@
+from multiprocessing.shared_memory import SharedMemory
+import pandas as pd
+import numpy as np
+
+
+
+# frames attached by this process, keyed by shared memory name, the most
+# recently used last
+_attached: dict[str, tuple[SharedMemory, pd.DataFrame]] = {}
+_max_attached = 16
+
+
+
+def _frame(shm: SharedMemory, columns: list[str], length: int, freq: str | None):
+    index = np.ndarray((length,), dtype='datetime64[ns]', buffer=shm.buf)
+    values = np.ndarray((length, len(columns)), dtype=float,
+                        buffer=shm.buf, offset=index.nbytes)
+    return pd.DataFrame(values, columns=columns, copy=False,
+                        index=pd.DatetimeIndex(index, freq=freq, copy=False))
+
+
+def _release_oldest():
+    # drop the least recently used attachments, opening a memory to see if
+    # its owner unlinked it would register it again with the resource tracker
+    while len(_attached) >= _max_attached:
+        shm, _ = _attached.pop(next(iter(_attached)))
+        try:
+            shm.close()
+        except BufferError:
+            # still referenced, left to the garbage collector
+            pass
+
+
+def attach_frame(name: str, columns: list[str], length: int, freq: str | None) -> pd.DataFrame:
+    if name not in _attached:
+        _release_oldest()
+        shm = SharedMemory(name=name)
+        _attached[name] = (shm, _frame(shm, columns, length, freq))
+    _attached[name] = _attached.pop(name)
+    return _attached[name][1]
+
+
+
+def shared_values(frame: pd.DataFrame) -> np.ndarray:
+    # the values of a frame of SharedFrame or attach_frame, a single float
+    # block so no copy is made, writes to them are seen by every process
+    return frame.to_numpy()
+
+
+
+class SharedFrame:
+    """Float DataFrame with a DatetimeIndex published in shared memory.
+
+    Pickling only sends the memory handle, the receiving process gets a
+    zero-copy DataFrame over the shared buffer. The owner must close() it
+    (or use it as a context manager) once every reader is done.
+    """
+
+    def __init__(self, data: pd.DataFrame) -> None:
+        self.columns = list(data.columns)
+        self.length = len(data)
+        self.freq = data.index.freqstr
+
+        index = data.index.values.astype('datetime64[ns]')
+        values = data.to_numpy(dtype=float)
+        self.shm = SharedMemory(create=True, size=max(index.nbytes + values.nbytes, 1))
+        np.ndarray(index.shape, dtype=index.dtype, buffer=self.shm.buf)[:] = index
+        np.ndarray(values.shape, dtype=float, buffer=self.shm.buf,
+                   offset=index.nbytes)[:] = values
+        self.data = _frame(self.shm, self.columns, self.length, self.freq)
+    
+    def close(self):
+        self.data = None
+        self.shm.close()
+        self.shm.unlink()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __reduce__(self):
+        return (attach_frame, (self.shm.name, self.columns, self.length, self.freq))
@@ -0,0 +1,138 @@
+import unittest
+import pickle
+import numpy as np
+import pandas as pd
+from src.utils.backtest.backtest import backtest_by_weight, fast_backtest_by_weight, \
+    backtest_by_weights, fast_scorable, report_record
+from src.utils.backtest.runner import trade_weight, weight_trade_group
+from src.signal.rebalance.state_maximization import GetWeightFn
+from src.signal.rebalance.gcsm import GcKlineState
+from src.signal.rebalance.gcsm import GoldenCrossStateMaximization
+
+
+
+
+def case(seed: int, n=400):
+    rs = np.random.RandomState(seed)
+    index = pd.date_range('2020-01-01', periods=n, freq='D')
+    close = pd.Series(100 * np.exp(np.cumsum(rs.normal(0, 0.04, n))), index=index)
+    # weights on the 0.1 grid the signals trade, held for a few bars
+    weights = pd.Series(np.round(rs.rand(n), 1), index=index)
+    weights[rs.rand(n) < 0.5] = np.nan
+    weights.iloc[0] = 0.5
+    return close, weights
+
+
+
+
+class TestFastBacktest(unittest.TestCase):
+    def check(self, close, weights, **kwargs):
+        res, report = backtest_by_weight(close, weights, include_baseline=False, **kwargs)
+        fast_res, fast_report = fast_backtest_by_weight(close, weights, **kwargs)
+        np.testing.assert_allclose(fast_res['strategy_equity'], res['strategy_equity'],
+                                   rtol=1e-9)
+        for k in ['End Value', 'Total Return [%]', 'Max Drawdown [%]', 'Total Fees Paid',
+                  'Log Sharpe Ratio']:
+            self.assertAlmostEqual(fast_report[k], report[k], delta=1e-9 * max(abs(report[k]), 1), msg=k)
+
+    def test_fees(self):
+        for seed, fees in enumerate([0.0, 0.001, 0.01, 0.1]):
+            self.check(*case(seed), fees=fees)
+
+    def test_size_granularity(self):
+        for seed, (fees, granularity) in enumerate([(0.001, 1e-3), (0.001, 0.1),
+                                                    (0.01, 1.0), (0.1, 0.5)]):
+            self.check(*case(10 + seed), fees=fees, size_granularity=granularity)
+
+    def test_short_of_cash(self):
+        # full and leveraged targets buy what the cash covers after fees
+        close, weights = case(20)
+        weights = weights.where(weights.isna(), np.where(weights > 0.5, 1.5, 1.0))
+        for granularity in [None, 0.01]:
+            self.check(close, weights, fees=0.01, size_granularity=granularity)
+
+
+
+
+class TestBatchedScoring(unittest.TestCase):
+    def test_backtest_by_weights(self):
+        # 7 weights in chunks of 3, the last one short
+        close, _ = case(40)
+        weights = pd.concat([ case(40 + i)[1].ffill() for i in range(7) ], axis=1,
+                            keys=range(7))
+        table = backtest_by_weights(close, weights, initial_cash=1000, fees=0.001, chunk_size=3)
+        self.assertEqual(len(table), 7)
+        for i, (_, row) in enumerate(table.iterrows()):
+            _, report = backtest_by_weight(close, weights[i], initial_cash=1000, fees=0.001,
+                                           include_baseline=False)
+            np.testing.assert_equal(report_record(row), report.compact())
+
+    def test_weight_trade_group(self):
+        close, _ = case(41, n=300)
+        data = pd.DataFrame({ 'open': close, 'high': close, 'low': close,
+                              'close': close, 'volume': 1.0 })
+        get_weight = GetWeightFn(0.001, GcKlineState())
+        params_list = [ dict(lookback=lookback, forward_length=forward_length, fee_adj=1, offset=0)
+                        for lookback in [20, 40, 60] for forward_length in [1, 2] ] + \
+            [ dict(lookback=30, forward_length=1, fee_adj=2, offset=1) ]
+        kwargs = dict(data=data, get_state=get_weight._get_state,
+                      get_state_params=dict(state_target='close', ema_fast_length=5,
+                                            ema_slow_length=20),
+                      get_weight=get_weight._get_weight_from_state,
+                      trade_freq=pd.Timedelta('1d'), fee=0.001, start_equity=10000, compact=True)
+
+        single = weight_trade_group(params_list, **kwargs)
+        for batch_size in [3, 64]:
+            batched = weight_trade_group(params_list, batch_size=batch_size, **kwargs)
+            self.assertEqual([ p for p, _ in batched ], params_list)
+            for (_, report), (_, batched_report) in zip(single, batched):
+                np.testing.assert_equal(batched_report, report)
+
+
+
+
+class TestReport(unittest.TestCase):
+    def test_compact(self):
+        # plain floats, without the equity curve
+        close, weights = case(30)
+        for _, report in [ backtest_by_weight(close, weights, include_baseline=False),
+                           fast_backtest_by_weight(close, weights) ]:
+            compact = report.compact()
+            self.assertIs(type(compact), dict)
+            self.assertEqual(list(compact), [ k for k in report if k in compact ])
+            self.assertIn('Avg. Annual Return [%]', compact)
+            for k, v in compact.items():
+                self.assertIs(type(v), float)
+                np.testing.assert_equal(v, float(report[k]))
+            self.assertLess(len(pickle.dumps(compact)), 2000)
+
+    def test_baseline_on_request(self):
+        close, weights = case(31)
+        weight = weights.ffill().to_frame('weight')
+        res, _ = trade_weight(close.to_frame('close'), weight, pd.Timedelta('1d'), 0.001, 1000)
+        self.assertNotIn('baseline_equity', res)
+        res, _, baseline = trade_weight(close.to_frame('close'), weight, pd.Timedelta('1d'), 0.001, 1000,
+                                        return_baseline_report=True)
+        self.assertIn('baseline_equity', res)
+        self.assertGreater(baseline['End Value'], 0)
+
+    def test_fast_scorable(self):
+        # vectorbt only metrics are not in fast reports, a score_metric
+        # reading them is scored with vectorbt
+        close, weights = case(32)
+        _, report = fast_backtest_by_weight(close, weights)
+        self.assertNotIn('Sharpe Ratio', report)
+
+        for score_metric, fast in [ (None, True),
+                                    (lambda x: x['Log Sharpe Ratio'] - x['Max Drawdown [%]'], True),
+                                    (lambda x: x['Sharpe Ratio'], False) ]:
+            config = { 'trade_freq': pd.to_timedelta('1d'), 'lookback': [60],
+                       'forward_length': [1], 'opt_range': 400, 'opt_freq': 30 }
+            if score_metric is not None:
+                self.assertEqual(fast_scorable(score_metric), fast)
+                config['score_metric'] = score_metric
+            sm = GoldenCrossStateMaximization(
+                config=config,
+                kline_state_config={ 'state_target': ['close'],
+                                     'ema_fast_length': [12], 'ema_slow_length': [26] })
+            self.assertEqual(sm.config.fast_scoring, fast)
@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import asyncio
+from src.core.data import DataBroker, AsyncDataBroker
+
+
+
+
+def klines(start: str, n: int) -> pd.DataFrame:
+    close = 100 + np.arange(n, dtype=float)
+    return pd.DataFrame({ 'open': close, 'high': close + 1, 'low': close - 1,
+                          'close': close, 'volume': 1.0 },
+                        index=pd.date_range(start, periods=n, freq='1d'))
+
+
+
+class FakeExchange:
+    # klines opened in [since, since + min(limit, cap)), as okx pages them
+    def __init__(self, df: pd.DataFrame, cap=100) -> None:
+        self.df = df
+        self.cap = cap
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe='1d', since=None, limit=None, params={}):
+        self.calls.append((since, limit))
+        start = pd.to_datetime(since, unit='ms')
+        end = start + min(limit or 100, self.cap) * pd.to_timedelta(timeframe)
+        df = self.df.loc[start:end - pd.Timedelta(1)]
+        return [ [ int(t.value // 10**6), *row ]
+                 for t, row in zip(df.index, df.to_numpy().tolist()) ]
+
+
+
+
+class AsyncFakeExchange(FakeExchange):
+    # FakeExchange on ccxt.async_support, records the pages in flight
+    def __init__(self, df: pd.DataFrame, cap=100) -> None:
+        super().__init__(df, cap)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe='1d', since=None, limit=None, params={}):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return super().fetch_ohlcv(symbol, timeframe, since, limit, params)
+
+    async def close(self):
+        pass
+
+
+
+class TestDataBroker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = patch('src.core.time.mockable_current_datetime')
+        self.now.start().return_value = pd.to_datetime('2021-01-01').to_pydatetime()
+
+    def tearDown(self) -> None:
+        self.now.stop()
+
+    def test_pages(self):
+        df = klines('2019-01-01', 731)
+        ex = FakeExchange(df, cap=30)
+        res = DataBroker(ex, 'BTC/USDT', '1d', page_size=50).get(limit=400)
+        pd.testing.assert_frame_equal(res, df.iloc[-400:], check_freq=False, check_names=False)
+        self.assertTrue(all(limit <= 50 for _, limit in ex.calls))
+
+    def test_lagging_newest_kline(self):
+        # the last closed kline is not out yet
+        df = klines('2019-01-01', 730)
+        dt = DataBroker(FakeExchange(df), 'BTC/USDT', '1d', max_length=500)
+        res = dt.get(limit=400)
+        self.assertEqual(res.index[0], pd.to_datetime('2021-01-01') - 400 * pd.Timedelta('1d'))
+        self.assertTrue(res.iloc[:-1].notna().all().all())
+        self.assertIsNone(dt._start_limit)
+
+        # later queries are not cut short
+        dt.ring.clear()
+        self.assertEqual(dt.get(limit=400)['close'].count(), 399)
+
+    def test_before_listing(self):
+        df = klines('2020-10-01', 92)
+        dt = DataBroker(FakeExchange(df), 'BTC/USDT', '1d', max_length=500)
+        res = dt.get(limit=400)
+        self.assertEqual(dt._start_limit, df.index[0])
+        pd.testing.assert_frame_equal(res, df, check_freq=False, check_names=False)
+
+    def test_nothing_listed(self):
+        dt = DataBroker(FakeExchange(klines('2019-01-01', 0)), 'BTC/USDT', '1d')
+        self.assertEqual(len(dt.get(limit=10)), 0)
+
+
+
+
+class TestAsyncDataBroker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = patch('src.core.time.mockable_current_datetime')
+        self.now.start().return_value = pd.to_datetime('2021-01-01').to_pydatetime()
+
+    def tearDown(self) -> None:
+        self.now.stop()
+
+    def test_concurrent_pages(self):
+        df = klines('2019-01-01', 731)
+        ex = AsyncFakeExchange(df)
+        dt = AsyncDataBroker(ex, 'BTC/USDT', '1d', page_size=50, max_concurrency=4)
+        res = dt.get(limit=400)
+        pd.testing.assert_frame_equal(res, df.iloc[-400:], check_freq=False, check_names=False)
+        self.assertEqual(len(ex.calls), 8)
+        self.assertEqual(ex.max_in_flight, 4)
+
+    def test_short_pages(self):
+        # pages capped below page_size are completed, without NaN holes
+        df = klines('2019-01-01', 731)
+        ex = AsyncFakeExchange(df, cap=30)
+        dt = AsyncDataBroker(ex, 'BTC/USDT', '1d', page_size=50)
+        res = dt.get(limit=400)
+        pd.testing.assert_frame_equal(res, df.iloc[-400:], check_freq=False, check_names=False)
+        self.assertTrue(all(limit <= 50 for _, limit in ex.calls))
+
+    def test_before_listing(self):
+        df = klines('2020-10-01', 92)
+        dt = AsyncDataBroker(AsyncFakeExchange(df), 'BTC/USDT', '1d', max_length=500)
+        res = dt.get(limit=400)
+        self.assertEqual(dt._start_limit, df.index[0])
+        pd.testing.assert_frame_equal(res, df, check_freq=False, check_names=False)
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from src.utils.backtest.em_weight import maximize_return_points_batch, \
+    maximize_return_points_exact
+
+
+
+
+FEES = dict(patial_entry_fee=0.001, patial_exit_fee=0.001, exit_fee=0.0005)
+
+
+def score(ret, mask, frac, prev, patial_entry_fee=0, patial_exit_fee=0, exit_fee=0):
+    # mean-log objective of the solvers
+    diff = np.abs(frac - prev)[:, None]
+    g = ret * frac[:, None] + 1 - diff * patial_entry_fee \
+        - (1 + ret) * diff * patial_exit_fee - np.abs(frac)[:, None] * exit_fee
+    return np.where(mask, np.log(np.where(mask, g, 1)), 0).sum(axis=-1)
+
+
+
+
+class TestExactSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        rs = np.random.RandomState(0)
+        self.ret = rs.normal(0.002, 0.04, (200, 120))
+        self.mask = rs.rand(*self.ret.shape) > 0.3
+        self.prev = rs.choice([0, 0.3, 1], len(self.ret))
+
+    def test_matches_fine_grid(self):
+        for fees in [{}, FEES]:
+            exact = maximize_return_points_exact(self.ret, self.mask, prev=self.prev, **fees)
+            grid = maximize_return_points_batch(self.ret, self.mask, rng=np.linspace(0, 1, 2001),
+                                                prev=self.prev, **fees)
+            np.testing.assert_allclose(exact, grid, atol=2e-3)
+            # never scores below the grid the signals use by default
+            coarse = maximize_return_points_batch(self.ret, self.mask, rng=np.arange(0, 1.01, 0.1),
+                                                  prev=self.prev, **fees)
+            self.assertTrue((score(self.ret, self.mask, exact, self.prev, **fees) >=
+                             score(self.ret, self.mask, coarse, self.prev, **fees) - 1e-9).all())
+
+    def test_all_positive(self):
+        ret = np.abs(self.ret) + 1e-3
+        for fees in [{}, FEES]:
+            np.testing.assert_array_equal(
+                maximize_return_points_exact(ret, self.mask, prev=self.prev, **fees), 1.0)
+            np.testing.assert_array_equal(
+                maximize_return_points_batch(ret, self.mask, prev=self.prev, **fees), 1.0)
+
+    def test_all_negative(self):
+        ret = -np.abs(self.ret) - 1e-3
+        for fees in [{}, FEES]:
+            np.testing.assert_array_equal(
+                maximize_return_points_exact(ret, self.mask, prev=self.prev, **fees), 0.0)
+            np.testing.assert_array_equal(
+                maximize_return_points_batch(ret, self.mask, prev=self.prev, **fees), 0.0)
+
+    def test_empty(self):
+        mask = np.zeros(self.ret.shape, dtype=bool)
+        np.testing.assert_array_equal(
+            maximize_return_points_exact(self.ret, mask, prev=self.prev), 0.5)
+        np.testing.assert_array_equal(
+            maximize_return_points_exact(self.ret, mask, prev=self.prev, default=None), self.prev)
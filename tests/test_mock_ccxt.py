@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+import ccxt
+from backtest.ccxt import getMockCcxt
+from src.utils.calc import calc_precision
+
+
+
+
+MARKETS = {
+    'BTC/USDT': { 'base': 'BTC', 'quote': 'USDT', 'taker': 0.001, 'maker': 0.0008,
+                  'precision': { 'amount': 1e-8, 'price': 0.1 },
+                  'limits': { 'amount': { 'min': 1e-5 } } },
+    'ETH/USDT': { 'base': 'ETH', 'quote': 'USDT', 'taker': 0.001, 'maker': 0.0008,
+                  'precision': { 'amount': 1e-8, 'price': 0.1 },
+                  'limits': { 'amount': { 'min': 1e-5 } } }
+}
+
+
+class FakeOkx(ccxt.okx):
+    def load_markets(self, reload=False, params={}):
+        return MARKETS
+
+
+
+
+class TestOrderBook(unittest.TestCase):
+    def exchange(self, max_volume_ratio=None):
+        return getMockCcxt(FakeOkx, { 'USDT': 10 ** 6, 'BTC': 1000, 'ETH': 1000 }, None, {},
+                           max_volume_ratio=max_volume_ratio)
+
+    def test_full_fill(self):
+        # amounts whose division by the precision is not exact still fill
+        # in full on the bar crossing them
+        ex = self.exchange()
+        rs = np.random.RandomState(0)
+        amounts = [ calc_precision(a, 1e-8, np.floor) for a in rs.uniform(0.001, 1, 100) ]
+        orders = [ ex.create_order('BTC/USDT', 'limit', side, amount, 100.0)
+                   for amount in amounts for side in ['buy', 'sell'] ]
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=1.0)
+        for order in orders:
+            order = ex.fetch_order(order['id'])
+            self.assertEqual(order['status'], 'closed')
+            self.assertEqual(order['filled'], order['amount'])
+            self.assertEqual(order['remaining'], 0)
+
+    def test_volume_cap(self):
+        # limit orders of a bar fill at most max_volume_ratio of its volume,
+        # best price first, the rest is carried to the next bars
+        ex = self.exchange(max_volume_ratio=0.1)
+        first = ex.create_order('BTC/USDT', 'limit', 'buy', 0.29, 100.0)
+        second = ex.create_order('BTC/USDT', 'limit', 'buy', 0.1, 99.5)
+
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=2.0)
+        first, second = ex.fetch_order(first['id']), ex.fetch_order(second['id'])
+        self.assertEqual(first['status'], 'open')
+        self.assertAlmostEqual(first['filled'], 0.2, places=12)
+        self.assertAlmostEqual(first['remaining'], 0.09, places=12)
+        self.assertEqual(second['filled'], 0)
+
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=1.0)
+        first, second = ex.fetch_order(first['id']), ex.fetch_order(second['id'])
+        self.assertEqual(first['status'], 'closed')
+        self.assertAlmostEqual(first['filled'], 0.29, places=12)
+        self.assertEqual(second['status'], 'open')
+        self.assertAlmostEqual(second['filled'], 0.01, places=12)
+
+        # a bar not reaching the price fills nothing
+        ex.__tick__(100.0, 101.0, 99.8, 'BTC/USDT', volume=10.0)
+        self.assertAlmostEqual(ex.fetch_order(second['id'])['filled'], 0.01, places=12)
+
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=10.0)
+        second = ex.fetch_order(second['id'])
+        self.assertEqual(second['status'], 'closed')
+        self.assertEqual(second['remaining'], 0)
+        self.assertAlmostEqual(second['filled'], 0.1, places=12)
+
+    def test_cancel(self):
+        ex = self.exchange(max_volume_ratio=0.1)
+        order = ex.create_order('BTC/USDT', 'limit', 'sell', 0.5, 100.0)
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=1.0)
+        self.assertEqual(ex.cancel_order(order['id'])['status'], 'canceled')
+        balance = dict(ex.fetch_balance()['total'])
+
+        ex.__tick__(100.0, 101.0, 99.0, 'BTC/USDT', volume=10.0)
+        order = ex.fetch_order(order['id'])
+        self.assertEqual(order['status'], 'canceled')
+        self.assertAlmostEqual(order['filled'], 0.1, places=12)
+        self.assertEqual(ex.fetch_balance()['total'], balance)
+        self.assertEqual(ex.orders.open(), [])
+
+    def test_symbol_prices(self):
+        # every book matches at the price of its own symbol
+        ex = self.exchange()
+        ex.__tick__(60.0, 60.0, 60.0, 'ETH/USDT')
+        limit = ex.create_order('ETH/USDT', 'limit', 'buy', 1.0, 50.0)
+        ex.__tick__(40.0, 41.0, 39.0)
+        market = ex.create_order('BTC/USDT', 'market', 'buy', 1.0)
+        self.assertEqual(ex.fetch_order(market['id'])['average'], 40.0)
+        self.assertEqual(ex.fetch_order(limit['id'])['status'], 'open')
+
+        market = ex.create_order('ETH/USDT', 'market', 'sell', 1.0)
+        self.assertEqual(ex.fetch_order(market['id'])['average'], 60.0)
+
+        ex.__tick__(55.0, 56.0, 49.0, 'ETH/USDT')
+        self.assertEqual(ex.fetch_order(limit['id'])['status'], 'closed')
+        self.assertEqual(ex.fetch_order(limit['id'])['average'], 50.0)
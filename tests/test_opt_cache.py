@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch
+import pickle
+import numpy as np
+import pandas as pd
+from src.core.db import State
+from src.signal.rebalance import state_maximization
+from src.signal.rebalance.gcsm import GoldenCrossStateMaximization
+from src.signal.rebalance.state_maximization import GetWeightFn
+from src.utils.shared import SharedFrame
+
+
+
+
+rs = np.random.RandomState(3)
+close = 100 * np.exp(np.cumsum(rs.normal(0.001, 0.03, 700)))
+KLINES = pd.DataFrame({ 'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1.0 },
+                      index=pd.date_range('2020-01-01', periods=len(close), freq='D'))
+PARAMS = dict(lookback=60, forward_length=1, fee_adj=1, offset=0)
+
+
+def signal(lookback: list[int]):
+    return GoldenCrossStateMaximization(
+        config={ 'trade_freq': pd.to_timedelta('1d'), 'lookback': lookback,
+                 'forward_length': [1], 'opt_range': 400, 'opt_freq': 30,
+                 'save_opt_cache': True },
+        kline_state_config={ 'state_target': ['close'],
+                             'ema_fast_length': [12], 'ema_slow_length': [26] })
+
+
+
+
+class TestWarmStart(unittest.TestCase):
+    def test_warm_matches_cold(self):
+        get_weight = GetWeightFn(0.001, signal([60]).kline_state)
+        kline_params = dict(state_target='close', ema_fast_length=12, ema_slow_length=26)
+        previous = None
+        for start in [0, 30, 60]:
+            state = get_weight._get_state(KLINES.iloc[start:start + 400], **kline_params)
+            cold = get_weight._get_weight_from_state(state.copy(), **PARAMS)
+            columns = ['state', 'ret', 2]
+            with SharedFrame(pd.DataFrame(np.nan, index=state.index, columns=columns)) as out:
+                # as a worker gets them
+                cache = pickle.loads(pickle.dumps((previous, 2, out, 2)))
+                if previous is not None:
+                    # most bars reuse the fractions of the previous window
+                    _, _, _, first, last = state_maximization.state_match_windows(
+                        state['state'].to_numpy(dtype=float), state['ret'].to_numpy(dtype=float),
+                        PARAMS['lookback'], 1, 0, PARAMS['lookback'])
+                    known, _, _ = get_weight._reusable(get_weight._frame_cache(previous.data, 2),
+                                                       state, PARAMS['lookback'], first, last)
+                    self.assertGreater(known.mean(), 0.5)
+                    previous.close()
+                warm, res = get_weight._get_weight_warm(state.copy(), **PARAMS, cache=cache)
+                self.assertIsNone(res)
+                pd.testing.assert_frame_equal(warm, cold)
+                np.testing.assert_array_equal(out.data['state'], state['state'])
+                computed = cold['ret_count'].notna()
+                np.testing.assert_array_equal(out.data[2][computed], cold['weight'][computed])
+                self.assertTrue(out.data[2][~computed].isna().all())
+                previous = SharedFrame(out.data.copy())
+        previous.close()
+
+
+
+
+class TestOptCache(unittest.TestCase):
+    def optimize(self, sm, data):
+        sizes = []
+        stream_jobs = state_maximization.stream_jobs
+
+        def spy(executor, fn, jobs, **kwargs):
+            def sized(jobs):
+                for job in jobs:
+                    sizes.append(len(pickle.dumps(job)))
+                    yield job
+            return stream_jobs(executor, fn, sized(jobs), **kwargs)
+
+        with patch('src.signal.rebalance.state_maximization.stream_jobs', spy):
+            sm.optimize(data, 0.001, now=data.index[-1])
+        return sizes
+
+    def test_tasks_and_pruning(self):
+        sm = signal([60, 70, 80])
+        sm.inject_state(State())
+        self.optimize(sm, KLINES.iloc[:400])
+        frame, = sm._opt_cache.values()
+        self.assertEqual(len(frame.columns), 2 + 3)
+
+        # tasks carry handles of the caches, not the caches
+        sizes = self.optimize(sm, KLINES.iloc[30:430])
+        frame, = sm._opt_cache.values()
+        self.assertEqual(frame.index[0], KLINES.index[30])
+        self.assertLess(max(sizes), 4 * 8 * 400)
+
+        # only the params of the space are kept, and saved
+        sm.config.lookback = [70, 90]
+        self.optimize(sm, KLINES.iloc[60:460])
+        frame, = sm._opt_cache.values()
+        self.assertEqual(sorted(dict(label)['lookback'] for label in frame.columns[2:]), [70, 90])
+        self.assertEqual(sm.state['opt_cache']['count'], 2)
+
+        restored = signal([70, 90])
+        restored.inject_state(sm.state)
+        frame_, = restored._opt_cache.values()
+        pd.testing.assert_frame_equal(frame_, frame, check_freq=False)
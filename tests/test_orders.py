@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+import threading
+import ccxt
+from src.core.orders import OrderTracker, OrderTimeout
+
+
+
+
+class Clock:
+    # stands in for monotonic and sleep of src.core.orders
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+
+class DelayedFillExchange:
+    # orders are open until fill_delay seconds after they are created,
+    # then closed, or status if given
+    def __init__(self, fill_delay: float, status='closed', clock=monotonic) -> None:
+        self.fill_delay = fill_delay
+        self.status = status
+        self.clock = clock
+        self.created = {}
+        self.fetches = []
+        self.lock = threading.Lock()
+
+    def create_order(self, id: str, symbol='BTC/USDT'):
+        self.created[id] = self.clock()
+        return { 'id': id, 'symbol': symbol, 'status': 'open' }
+
+    def fetch_order(self, id, symbol=None, params={}):
+        now = self.clock()
+        with self.lock:
+            self.fetches.append((id, now))
+        filled = now - self.created[id] >= self.fill_delay
+        return { 'id': id, 'symbol': symbol, 'status': self.status if filled else 'open' }
+
+
+
+
+class TestOrderTracker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = Clock()
+        self.patches = [ patch('src.core.orders.monotonic', self.clock.monotonic),
+                         patch('src.core.orders.sleep', self.clock.sleep) ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self) -> None:
+        for p in self.patches:
+            p.stop()
+
+    def exchange(self, fill_delay: float, status='closed'):
+        return DelayedFillExchange(fill_delay, status, clock=self.clock.monotonic)
+
+    def test_backoff(self):
+        ex = self.exchange(3.0)
+        order = ex.create_order('a')
+        res = OrderTracker(ex, backoff=(0.1, 0.2, 0.5, 1.0)).wait([order])
+        self.assertEqual(res[0]['status'], 'closed')
+        # the last delay repeats until the fill
+        self.assertEqual(self.clock.sleeps, [0.1, 0.2, 0.5, 1.0, 1.0, 1.0])
+        self.assertEqual([ round(t, 6) for _, t in ex.fetches ], [0, 0.1, 0.3, 0.8, 1.8, 2.8, 3.8])
+
+    def test_filled(self):
+        # no sleep for an order already closed
+        ex = self.exchange(0)
+        OrderTracker(ex).wait([ex.create_order('a')])
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(len(ex.fetches), 1)
+
+    def test_closed_not_fetched_again(self):
+        ex = self.exchange(0.25)
+        first = ex.create_order('a')
+        self.clock.now = 0.2
+        second = ex.create_order('b')
+        res = OrderTracker(ex, backoff=(0.1,)).wait([second, first])
+        self.assertEqual([ o['id'] for o in res ], ['b', 'a'])
+        self.assertEqual([ id for id, _ in ex.fetches ], ['b', 'a', 'b', 'a', 'b', 'b'])
+
+    def test_deadline(self):
+        ex = self.exchange(10)
+        orders = [ ex.create_order('a'), ex.create_order('b') ]
+        with self.assertRaises(OrderTimeout) as cm:
+            OrderTracker(ex, backoff=(1.0,), deadline=2.5).wait(orders)
+        # the last sleep is cut to the deadline
+        self.assertEqual(self.clock.sleeps, [1.0, 1.0, 0.5])
+        self.assertEqual([ o['id'] for o in cm.exception.pending ], ['a', 'b'])
+        self.assertIsInstance(cm.exception, ccxt.NetworkError)
+
+    def test_not_fillable(self):
+        ex = self.exchange(0.2, status='canceled')
+        with self.assertRaises(ccxt.OrderNotFillable):
+            OrderTracker(ex, deadline=10).wait([ex.create_order('a')])
+
+
+
+
+class TestOrderTrackerWakeUp(unittest.TestCase):
+    # on the real clock
+
+    def test_wake_up(self):
+        # a fill is seen on the next step of the schedule, not a second later
+        ex = DelayedFillExchange(0.05)
+        order = ex.create_order('a')
+        start = monotonic()
+        OrderTracker(ex, backoff=(0.1, 0.2, 0.5, 1.0)).wait([order])
+        self.assertLess(monotonic() - start, 0.5)
+
+    def test_concurrent(self):
+        ex = DelayedFillExchange(0.2)
+        orders = [ ex.create_order(str(i)) for i in range(50) ]
+        start = monotonic()
+        with ThreadPoolExecutor(16) as executor:
+            res = OrderTracker(ex, executor=executor).wait(orders)
+        self.assertLess(monotonic() - start, 1.0)
+        self.assertEqual([ o['id'] for o in res ], [ o['id'] for o in orders ])
+        self.assertTrue(all(o['status'] == 'closed' for o in res))
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import ccxt
+from backtest.ccxt import getMockCcxt
+from src.strategy.rebalance import RebalancePortfolioStrategy
+
+
+
+
+MARKETS = {
+    f'{base}/USDT': { 'base': base, 'quote': 'USDT', 'taker': 0.001, 'maker': 0.0008,
+                      'precision': { 'amount': 1e-8, 'price': 0.01 },
+                      'limits': { 'amount': { 'min': 1e-5 } } }
+    for base in ['BTC', 'ETH']
+}
+PRICES = { 'BTC/USDT': 20000.0, 'ETH/USDT': 1000.0 }
+NOW = pd.to_datetime('2021-01-01')
+
+
+class FakeOkx(ccxt.okx):
+    def load_markets(self, reload=False, params={}):
+        return MARKETS
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        index = pd.date_range(pd.to_datetime(since, unit='ms'), periods=limit, freq=timeframe)
+        price = PRICES[symbol]
+        return [ [ int(t.value // 10**6), price, price, price, price, 1.0 ] for t in index ]
+
+
+
+
+class TestRebalancePortfolio(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = patch('src.core.time.mockable_current_datetime')
+        self.now.start().return_value = NOW.to_pydatetime()
+
+    def tearDown(self) -> None:
+        self.now.stop()
+
+    def test_rebalance(self):
+        # BTC is over its target and ETH under it
+        ex = getMockCcxt(FakeOkx, { 'USDT': 1000.0, 'BTC': 0.2, 'ETH': 0.0 }, None, {})
+        for symbol, price in PRICES.items():
+            ex.__tick__(price, price, price, symbol)
+        created = []
+        create_order = ex.create_order
+
+        def spy(symbol, order_type, side, amount, price=None, params={}):
+            created.append((symbol, side))
+            return create_order(symbol, order_type, side, amount, price, params)
+        ex.create_order = spy
+
+        fractions = { 'BTC/USDT': 0.25, 'ETH/USDT': 0.5 }
+        strategy = RebalancePortfolioStrategy(ex, list(PRICES), '1d', fractions,
+                                              allocations={ 'BTC/USDT': 0.6, 'ETH/USDT': 0.4 },
+                                              live=True)
+        _, res = strategy.tick(NOW)
+
+        # sells free the quote currency for the buys
+        self.assertEqual(created, [('BTC/USDT', 'sell'), ('ETH/USDT', 'buy')])
+        self.assertTrue(all(r['traded'] for r in res.values()))
+
+        balance = ex.fetch_balance()['total']
+        equity = balance['USDT'] + sum(balance[MARKETS[s]['base']] * p for s, p in PRICES.items())
+        self.assertAlmostEqual(equity, 5000, delta=5000 * 0.001)
+        for symbol, allocation in [('BTC/USDT', 0.6), ('ETH/USDT', 0.4)]:
+            held = balance[MARKETS[symbol]['base']] * PRICES[symbol] / equity
+            self.assertAlmostEqual(held, allocation * fractions[symbol], delta=0.002)
+            self.assertEqual(res[symbol]['final_base_bal'], balance[MARKETS[symbol]['base']])
+        self.assertGreaterEqual(balance['USDT'], 0)
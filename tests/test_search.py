@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.signal.rebalance.search import SuccessiveHalvingSearch, ModelBasedSearch
+
+
+
+# unimodal score surface peaking at lookback 60, offset 3, forward_length 2
+SPACE = [ { 'lookback': l, 'offset': o, 'forward_length': f }
+          for l in range(20, 110, 10) for o in range(6) for f in [1, 2, 3] ]
+
+
+def surface(params):
+    return -((params['lookback'] - 60) / 10) ** 2 - (params['offset'] - 3) ** 2 \
+        - (params['forward_length'] - 2) ** 2
+
+
+
+
+class TestSuccessiveHalvingSearch(unittest.TestCase):
+    def test_rounds_score_recent_part_of_full_history(self):
+        data = pd.DataFrame({ 'close': np.arange(517.0) },
+                            index=pd.date_range('2020-01-01', periods=517, freq='D'))
+        space = [ { 'lookback': l } for l in range(115, 126) ]
+        calls = []
+
+        def evaluate(space, data, start=None):
+            calls.append((len(space), len(data), start))
+            for p in space:
+                yield p, p['lookback']
+
+        res = list(SuccessiveHalvingSearch(rate=3, min_length=91)
+                   .search(space, data, evaluate, lambda r: r))
+        # every round sees the whole history, the first one scores its last third
+        self.assertEqual(calls, [(11, 517, data.index[-172]), (4, 517, None)])
+        self.assertEqual([ p['lookback'] for p, _ in res ], [125, 124, 123, 122])
+
+    def test_no_round_warns(self):
+        data = pd.DataFrame({ 'close': np.arange(100.0) },
+                            index=pd.date_range('2020-01-01', periods=100, freq='D'))
+        space = [ { 'lookback': l } for l in range(10) ]
+        with self.assertLogs('bot_logger', level='WARNING'):
+            res = list(SuccessiveHalvingSearch(rate=3, min_length=60)
+                       .search(space, data, lambda s, d, start=None: ((p, 0) for p in s),
+                               lambda r: r))
+        self.assertEqual(len(res), 10)
+
+
+
+
+class TestModelBasedSearch(unittest.TestCase):
+    def search(self, budget, seed=42, space=SPACE, score=surface):
+        calls = []
+
+        def evaluate(space, data, start=None):
+            calls.append(len(space))
+            for p in space:
+                yield p, score(p)
+
+        res = list(ModelBasedSearch(budget, batch_size=8, seed=seed)
+                   .search(space, None, evaluate, lambda r: r))
+        return res, calls
+
+    def test_budget(self):
+        for budget in [1, 10, 48]:
+            res, calls = self.search(budget)
+            self.assertEqual(len(res), budget)
+            self.assertEqual(len({ tuple(p.items()) for p, _ in res }), budget)
+            # a random quarter first, then batches
+            self.assertEqual(calls[0], max(1, budget // 4))
+            self.assertTrue(all(c <= 8 for c in calls[1:]))
+
+        # nan scores count against the budget too
+        res, _ = self.search(20, score=lambda p: np.nan if p['offset'] == 3 else surface(p))
+        self.assertEqual(len(res), 20)
+
+        # a budget over the grid evaluates it once
+        space = SPACE[:30]
+        res, _ = self.search(100, space=space)
+        self.assertEqual(sorted(map(SPACE.index, (p for p, _ in res))), list(range(30)))
+
+    def test_deterministic(self):
+        res, calls = self.search(32)
+        self.assertEqual(self.search(32), (res, calls))
+        other, _ = self.search(32, seed=7)
+        self.assertNotEqual([ p for p, _ in other ], [ p for p, _ in res ])
+
+    def test_finds_optimum(self):
+        # with under a third of the grid evaluated
+        for seed in range(5):
+            res, _ = self.search(48, seed=seed)
+            best, score = max(res, key=lambda x: x[1])
+            self.assertEqual(best, { 'lookback': 60, 'offset': 3, 'forward_length': 2 })
+            self.assertEqual(score, 0)
@@ -0,0 +1,66 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from src.core.store import KlineStore
+
+
+
+
+def klines(start: str, n: int) -> pd.DataFrame:
+    close = 100 + np.arange(n, dtype=float)
+    return pd.DataFrame({ 'open': close, 'high': close + 1, 'low': close - 1,
+                          'close': close, 'volume': 1.0 },
+                        index=pd.date_range(start, periods=n, freq='1d'))
+
+
+
+
+class TestKlineStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = KlineStore(self.dir.name, 'okx', 'BTC/USDT', '1d')
+        self.df = klines('2020-01-01', 100)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def check(self, start: int, count: int):
+        self.assertEqual(self.store.span(), (self.df.index[start], count))
+        pd.testing.assert_frame_equal(self.store.read(self.df.index[start], count),
+                                      self.df.iloc[start:start + count],
+                                      check_freq=False, check_names=False)
+
+    def test_append(self):
+        self.store.append(self.df.iloc[10:50])
+        self.store.append(self.df.iloc[30:70])
+        self.check(10, 60)
+        # stored bars are not overwritten
+        self.store.append(self.df.iloc[20:30] * 2)
+        self.check(10, 60)
+
+    def test_prepend(self):
+        self.store.append(self.df.iloc[40:60])
+        self.store.append(self.df.iloc[10:50])
+        self.check(10, 50)
+        # with the bars after the stored ones
+        self.store.append(self.df.iloc[0:80])
+        self.check(0, 80)
+
+    def test_gaps(self):
+        # missing bars are not stored, they stay to be fetched
+        df = self.df.copy()
+        df.iloc[30] = np.nan
+        self.store.append(df.iloc[10:50])
+        self.check(10, 20)
+        self.store.append(df.drop(df.index[25]).iloc[:60])
+        self.check(0, 30)
+        self.store.append(self.df.iloc[25:60])
+        self.check(0, 60)
+
+    def test_apart(self):
+        # bars not joined to the stored ones are not stored either
+        self.store.append(self.df.iloc[40:60])
+        self.store.append(self.df.iloc[10:30])
+        self.store.append(self.df.iloc[70:80])
+        self.check(40, 20)
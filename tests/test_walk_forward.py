@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import ccxt
+from backtest.ccxt import getMockCcxt
+from backtest.controller import MockController
+from backtest.walk_forward import walk_forward, OfflineAccount
+from src.signal.rebalance.gcsm import GoldenCrossStateMaximization
+from src.strategy.rebalance import RebalanceSingleStrategy
+from src.core.db import State
+
+
+
+
+rs = np.random.RandomState(5)
+close = 5000 * np.exp(np.cumsum(rs.normal(0.0005, 0.035, 800)))
+KLINES = pd.DataFrame({ 'open': close, 'high': close * 1.01, 'low': close * 0.99,
+                        'close': close, 'volume': 1.0 },
+                      index=pd.date_range('2018-01-01', periods=len(close), freq='D'))
+MARKETS = {
+    'BTC/USDT': { 'base': 'BTC', 'quote': 'USDT', 'taker': 0.001, 'maker': 0.0008,
+                  'precision': { 'amount': 1e-8, 'price': 0.1 },
+                  'limits': { 'amount': { 'min': 1e-5 } } }
+}
+START, END = pd.to_datetime('2019-09-01'), pd.to_datetime('2019-12-31')
+
+
+class FakeOkx(ccxt.okx):
+    def load_markets(self, reload=False, params={}):
+        return MARKETS
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        df = KLINES.loc[pd.to_datetime(since, unit='ms'):].iloc[:limit]
+        return [ [ int(t.value // 10**6), *row ]
+                 for t, row in zip(df.index, df.to_numpy().tolist()) ]
+
+
+def signal():
+    return GoldenCrossStateMaximization(
+        config={ 'trade_freq': pd.to_timedelta('1d'), 'lookback': [115, 120],
+                 'forward_length': [1], 'fee_adj': [1],
+                 'opt_range': 365 + 152, 'opt_freq': 30 },
+        kline_state_config={ 'state_target': ['close'],
+                             'ema_fast_length': [12], 'ema_slow_length': [26] })
+
+
+
+
+class TestWalkForward(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # the integration loop of integration_backtest.py
+        with patch('src.core.time.mockable_current_datetime') as now:
+            now.return_value = (START - pd.to_timedelta('1d')).to_pydatetime()
+            ex = getMockCcxt(FakeOkx, { 'USDT': 1000, 'BTC': 0 }, None, {})
+            strategy = RebalanceSingleStrategy(ex=ex, symbol='BTC/USDT', timeframe='1d',
+                                               fraction=signal(), live=True)
+            controller = MockController({ 'strategy': strategy }, State())
+            ticks = []
+            for date in pd.date_range(START, END, freq='1d'):
+                now.return_value = date.to_pydatetime()
+                strategy.dt.get_klines(max(len(strategy.dt.cache), 1))
+                kline = strategy.dt.cache.iloc[-1]
+                ex.__tick__(kline['close'], kline['high'], kline['low'])
+                controller.tick()
+                ticks.append(dict(strategy.state['tick']))
+        cls.expected = pd.DataFrame(ticks).set_index('time')
+
+    def check(self, parallel: bool):
+        res = walk_forward(signal(), KLINES, START, END,
+                           OfflineAccount(1000, 0, MARKETS['BTC/USDT']['taker'], 1e-8, 1e-5),
+                           parallel=parallel)
+        self.assertTrue(self.expected['traded'].any())
+        pd.testing.assert_index_equal(res.index, self.expected.index)
+        for c in ['fraction', 'diff_base', 'final_quote_bal', 'final_base_bal',
+                  'final_equity', 'traded']:
+            np.testing.assert_array_equal(res[c].astype(float), self.expected[c].astype(float), err_msg=c)
+
+    def test_sequential(self):
+        self.check(parallel=False)
+
+    def test_parallel(self):
+        self.check(parallel=True)
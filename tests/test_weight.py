@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import patch
+from itertools import product
+import numpy as np
+import pandas as pd
+from src.signal.rebalance.state_maximization import GetWeightFn, IncrementalWeightFn
+from src.signal.rebalance.gcsm import GcKlineState
+from src.signal.rebalance.qqsm import QqKlineState
+
+
+
+
+rs = np.random.RandomState(1)
+close = 100 * np.exp(np.cumsum(rs.normal(0.001, 0.03, 400)))
+KLINES = pd.DataFrame({ 'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1.0 },
+                      index=pd.date_range('2020-01-01', periods=len(close), freq='D'))
+KLINE_STATES = [
+    (GcKlineState(), dict(state_target='close', ema_fast_length=5, ema_slow_length=20)),
+    (QqKlineState(), dict(state_target='close', qt_length=10, qt_steps=3, chain_length=2)),
+    (QqKlineState(), dict(state_target='ret', qt_length=10, qt_steps=3, chain_length=2)),
+]
+
+
+
+
+class TestVectorizedWeight(unittest.TestCase):
+    def test_matches_loop(self):
+        for kline_state, kline_params in KLINE_STATES[:2]:
+            vectorized = GetWeightFn(0.001, kline_state)
+            loop = GetWeightFn(0.001, kline_state, vectorized=False)
+            state = vectorized._get_state(KLINES.iloc[:150], **kline_params)
+
+            for lookback, (offset, forward_length), initial_w, lastest_only in \
+                product([20, 60], [(0, 1), (3, 3)], [None, 0.5, 1.0], [False, True]):
+                params = dict(lookback=lookback, forward_length=forward_length, fee_adj=1,
+                              offset=offset, initial_w=initial_w, lastest_only=lastest_only)
+                with self.subTest(kline_state=type(kline_state).__name__, **params):
+                    pd.testing.assert_frame_equal(
+                        vectorized._get_weight_from_state(state.copy(), **params),
+                        loop._get_weight_from_state(state.copy(), **params))
+
+
+
+
+class TestIncrementalWeight(unittest.TestCase):
+    def test_matches_full(self):
+        params = dict(lookback=60, forward_length=2, fee_adj=1, offset=1, initial_w=0.3)
+        for kline_state, kline_params in KLINE_STATES:
+            get_weight = GetWeightFn(0.001, kline_state)
+            incremental = IncrementalWeightFn(get_weight)
+            # the buffer grows to 150 klines then slides by 1 or 2, with a
+            # jump back in the middle
+            ticks = [ (0, end) for end in range(100, 150) ] + \
+                [ (end - 150, end) for end in range(150, 400) if end % 4 != 1 ]
+            ticks = ticks[:150] + [ (0, 150) ] + ticks[150:]
+
+            with patch.object(incremental, '_rebuild', wraps=incremental._rebuild) as rebuild:
+                for start, end in ticks:
+                    data = KLINES.iloc[start:end]
+                    with self.subTest(kline_state=type(kline_state).__name__,
+                                      state_target=kline_params['state_target'], end=end):
+                        row = incremental(data, **params, **kline_params)
+                        full = get_weight._get_weight(data, **params, **kline_params,
+                                                      lastest_only=True).iloc[-1]
+                        pd.testing.assert_series_equal(row[full.index].astype(full.dtype), full,
+                                                       check_exact=False, rtol=1e-12)
+
+            # only the first tick and the jump back start over
+            self.assertEqual(rebuild.call_count, 2)
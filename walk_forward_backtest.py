@@ -0,0 +1,39 @@
+from backtest.config import *
+from backtest.walk_forward import walk_forward, OfflineAccount
+from src.core.data import DataBroker, AsyncDataBroker
+import ccxt.async_support
+from src.core.logger import logger
+from src.signal.rebalance.gcsm import GoldenCrossStateMaximization
+
+
+
+
+if __name__ == '__main__':
+    signal = GoldenCrossStateMaximization(**INDICATOR_CONFIG)
+    market_info = ex.load_markets()[SYMBOL]
+    tfdelta = pd.to_timedelta(TIMEFRAME)
+
+    # klines are fetched once, the replay itself runs offline
+    first = start_date - (signal.config.opt_range + signal.get_length()) * tfdelta
+    if OFFLINE_DATA:
+        dt = DataBroker(ex, SYMBOL, TIMEFRAME,
+                        max_length=int((end_date - first) / tfdelta))
+        data = dt.get(start=first, end=end_date)
+    else:
+        # public klines, the pages of the range are fetched concurrently
+        dt = AsyncDataBroker(ccxt.async_support.okx({ 'enableRateLimit': True }),
+                             SYMBOL, TIMEFRAME,
+                             max_length=int((end_date - first) / tfdelta))
+        data = dt.get(start=first, end=end_date)
+        dt.close()
+    
+    account = OfflineAccount(quote_bal=start_equity,
+                             base_bal=0,
+                             trading_fee=market_info['taker'],
+                             base_precision=market_info['precision']['amount'],
+                             min_trade_base=market_info['limits']['amount']['min'])
+    results = walk_forward(signal, data, start_date, end_date, account)
+
+    results.to_csv(f'{test_name}-walk-forward.csv')
+    logger.info(f"final equity: {results['final_equity'].iloc[-1]} "
+                f"trades: {results['traded'].sum()}")